@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+
+# Command-line front end to the solvers, for batch runs without the GUI (and without Qt).
+# Generates the same scenario the GUI would for a given size, seed and difficulty (and,
+# since numpy is seeded too, the same one TSPBatch and TSPBenchmark make in 'Hard' mode,
+# which the GUI leaves random), runs the chosen solvers on it and prints each results
+# dictionary as one line of JSON.
+#
+#   python3 Proj5CLI.py --size 15 --seed 20 --difficulty 'Hard (Deterministic)' -a greedy -a branchAndBound
+#
+# --save-scenario writes the generated scenario to a binary file (see Scenario.save) and
+# --scenario runs on one loaded from such a file instead of generating it.
+
+import argparse
+import json
+import math
+import sys
+
+import numpy as np
+
+from TSPCache import ScenarioCache
+from TSPClasses import DIFFICULTIES, Scenario, TSPSolution, newPoints
+from TSPProfiler import Profiler
+from TSPSolver import ALGORITHMS, TSPSolver
+
+
+# Accepts either the TSPSolver method name or the GUI label (case-insensitive).
+def solverMethod( name ):
+	for label, method in ALGORITHMS:
+		if name == method or name.lower() == label.strip().lower():
+			return method
+	raise argparse.ArgumentTypeError( 'unknown algorithm {!r} (choose from {})'.format(
+		name, ', '.join(method for _, method in ALGORITHMS) ) )
+
+
+# Turns a results dictionary into something json can write: the solution becomes its list
+# of city indices, a profile its toDict(), numpy numbers become plain ones, and infinite
+# costs become null.
+def jsonable( value ):
+	if isinstance( value, TSPSolution ):
+		return [city._index for city in value.route]
+	if isinstance( value, Profiler ):
+		return jsonable( value.toDict() )
+	if isinstance( value, dict ):
+		return {str(key): jsonable(item) for key, item in value.items()}
+	if isinstance( value, (list, tuple) ):
+		return [jsonable(item) for item in value]
+	if hasattr( value, 'item' ):		# numpy scalar
+		value = value.item()
+	if isinstance( value, float ) and not math.isfinite( value ):
+		return None
+	return value
+
+
+def main( argv=None ):
+	parser = argparse.ArgumentParser( description='Run TSP solvers on a generated scenario.' )
+	parser.add_argument( '-n', '--size', type=int, help='number of cities' )
+	parser.add_argument( '-s', '--seed', type=int, default=0, help='random seed (as in the GUI)' )
+	parser.add_argument( '-d', '--difficulty', choices=DIFFICULTIES, default='Hard (Deterministic)' )
+	parser.add_argument( '-a', '--algorithm', type=solverMethod, action='append',
+						 help='solver to run (method name or GUI label); repeat to run several' )
+	parser.add_argument( '-t', '--time', type=float, default=60.0, help='time allowance per solver, in seconds' )
+	parser.add_argument( '--thin-version', type=int,
+						 help='hard-mode edge thinning algorithm (1 reproduces old graphs, 3 stores no edge mask; '
+							  'the default is {} up to {} cities and {} above)'.format(
+							  Scenario.THIN_VERSION, Scenario.DENSE_EDGE_LIMIT, Scenario.LAZY_EDGE_VERSION) )
+	parser.add_argument( '--scenario', help='load the scenario from this file instead of generating it' )
+	parser.add_argument( '--save-scenario', help='save the scenario to this file' )
+	parser.add_argument( '--cache', action='store_true',
+						 help='share setup work between the solvers and start each from the best tour so far' )
+	parser.add_argument( '--profile', action='store_true',
+						 help='time the solver phases and include the profile in the output' )
+	args = parser.parse_args( argv )
+	if args.scenario is None and args.size is None:
+		parser.error( 'one of --size or --scenario is required' )
+
+	if args.scenario:
+		scenario = Scenario.load( args.scenario )
+		params = scenario.params()
+		args.size, args.seed, args.difficulty = params['size'], params['seed'], params['difficulty']
+	else:
+		np.random.seed( args.seed )	# Hard mode thinning
+		points = newPoints( args.size, args.seed )
+		scenario = Scenario( city_locations=points, difficulty=args.difficulty,
+							 rand_seed=args.seed, thin_version=args.thin_version )
+	if args.save_scenario:
+		scenario.save( args.save_scenario )
+	solver = TSPSolver( None )
+	solver.setProfiling( args.profile )
+	if args.cache:
+		solver.setCache( ScenarioCache() )
+	for method in args.algorithm or ['greedy']:
+		solver.setupWithScenario( scenario )
+		np.random.seed( args.seed )	# the randomized solvers, as in TSPBatch
+		results = getattr( solver, method )( time_allowance=args.time )
+		record = {'algorithm': method, 'size': args.size, 'seed': args.seed,
+				  'difficulty': args.difficulty}
+		record.update( jsonable(results) )
+		if args.cache:
+			record['cache'] = solver.cache.stats()
+		print( json.dumps(record), flush=True )
+	return 0
+
+
+if __name__ == '__main__':
+	sys.exit( main() )
@@ -31,9 +31,23 @@ else:
 from TSPSolver import *
 #from TSPSolver_complete import *
 from TSPClasses import *
+from TSPCache import ScenarioCache
 
 
+# Draws cities, edges and labels.  Everything is drawn in batches: paintEvent works from
+# geometry that is scaled to the widget once and cached until the contents or the widget
+# size change (one drawLines call per edge colour, all of a colour's arrowheads in one
+# QPainterPath, all of a colour's cities in one drawPoints call).  Past a few hundred
+# labels, or when the cities are too close together on screen to read them, labels are
+# left out; past ARROW_LIMIT edges, or on edges too short to show one, so are arrowheads.
 class PointLineView( QWidget ):
+	ARROW_SIZE = 5.0			# pixels
+	ARROW_LIMIT = 2000			# edges
+	MIN_ARROW_EDGE = 15.0		# pixels; shorter edges get no arrowhead
+	LABEL_LIMIT = 300			# labels of one colour
+	MIN_LABEL_SPACING = 20.0	# average pixels between cities needed to show labels
+	CITY_SIZE = 2.0				# radius, in pixels
+
 	def __init__( self, status_bar, data_range ):
 		super(QWidget,self).__init__()
 		self.setMinimumSize(600,400)
@@ -45,12 +59,14 @@ class PointLineView( QWidget ):
 		self.data_range = data_range
 		self.start_pt = None
 		self.end_pt = None
+		self._geometry = None	# (scale, per-colour scaled geometry), see _scaledGeometry
 
 	def displayStatusText(self, text):
 		self.status_bar.showMessage(text)
 
 	def clearPoints(self):
 		self.pointList = {}
+		self._geometry = None
 
 	def clearEdges(self,removeColors = None):
 		self.edgeList = {}
@@ -60,6 +76,7 @@ class PointLineView( QWidget ):
 					del self.labelList[color]
 		else:
 			self.labelList = {}
+		self._geometry = None
 		self.repaint()
 
 	def addPoints( self, point_list, color ):
@@ -67,6 +84,7 @@ class PointLineView( QWidget ):
 			self.pointList[color].extend( point_list )
 		else:
 			self.pointList[color] = point_list
+		self._geometry = None
 
 #	def setStartLoc( self, point ):
 #		self.start_pt = point
@@ -100,104 +118,160 @@ class PointLineView( QWidget ):
 			self.labelList[labelColor].append( (point,label,xoffset) )
 		else:
 			self.labelList[labelColor] = [(point,label,xoffset)]
+		self._geometry = None
 
-
-
+	def _scale( self ):
+		xr = self.data_range['x']
+		yr = self.data_range['y']
+		w2h_desired_ratio = (xr[1]-xr[0])/(yr[1]-yr[0])
+		if self.width() / self.height() < w2h_desired_ratio:
+			return self.width() / (xr[1]-xr[0])
+		return self.height() / (yr[1]-yr[0])
+
+	# Everything in pixels relative to the widget's centre, y up: per colour the edge
+	# lines and a path of their arrowheads, the city positions, and the label positions.
+	def _scaledGeometry( self, scale ):
+		if self._geometry is not None and self._geometry[0] == scale:
+			return self._geometry[1]
+		arrows = sum( len(edges) for edges in self.edgeList.values() ) <= self.ARROW_LIMIT
+		edges = {}
+		for color, colorEdges in self.edgeList.items():
+			lines = [QLineF( scale*edge.x1(), scale*edge.y1(), scale*edge.x2(), scale*edge.y2() ) for edge in colorEdges]
+			heads = QPainterPath()
+			if arrows:
+				a = self.ARROW_SIZE
+				for line in lines:
+					length = line.length()
+					if length < self.MIN_ARROW_EDGE:
+						continue
+					ux, uy = line.dx() / length, line.dy() / length
+					tip = line.p2()
+					heads.addPolygon( QPolygonF( [tip,
+												 tip - QPointF( a*(2*ux - uy), a*(2*uy + ux) ),
+												 tip - QPointF( a*(2*ux + uy), a*(2*uy - ux) )] ) )
+					heads.closeSubpath()
+			edges[color] = (lines, heads)
+		points = {color: QPolygonF( [QPointF(scale*point.x(), scale*point.y()) for point in colorPoints] )
+				  for color, colorPoints in self.pointList.items()}
+		labels = {color: [(scale*pt.x() + xoff, scale*pt.y(), text) for pt, text, xoff in colorLabels]
+				  for color, colorLabels in self.labelList.items() if len(colorLabels) <= self.LABEL_LIMIT}
+		geometry = (edges, points, labels)
+		self._geometry = (scale, geometry)
+		return geometry
+
+	# Labels are only legible if the cities are not packed closer than MIN_LABEL_SPACING.
+	def _showLabels( self, scale ):
+		ncities = sum( len(points) for points in self.pointList.values() )
+		if ncities == 0:
+			return True
+		xr = self.data_range['x']
+		yr = self.data_range['y']
+		return scale * math.sqrt( (xr[1]-xr[0]) * (yr[1]-yr[0]) / ncities ) >= self.MIN_LABEL_SPACING
 
 	def paintEvent(self, event):
 		painter = QPainter(self)
 		painter.setRenderHint(QPainter.RenderHint.Antialiasing,True)
-
-		xr = self.data_range['x']
-		yr = self.data_range['y']
-		w = self.width()
-		h = self.height()
-		w2h_desired_ratio = (xr[1]-xr[0])/(yr[1]-yr[0])
-		if w / h < w2h_desired_ratio:
-			 scale = w / (xr[1]-xr[0])
-		else:
-			 scale = h / (yr[1]-yr[0])
+		scale = self._scale()
+		edges, points, labels = self._scaledGeometry( scale )
+		cx, cy = self.width()/2.0, self.height()/2.0
 
 		tform = QTransform()
-		tform.translate(self.width()/2.0,self.height()/2.0)
+		tform.translate(cx,cy)
 		tform.scale(1.0,-1.0)
 		painter.setTransform(tform)
 
-		for color in self.edgeList:
-			c = QColor(color[0],color[1],color[2])
-			painter.setPen( c )
-			for edge in self.edgeList[color]:
-				ln = QLineF( scale*edge.x1(), scale*edge.y1(), scale*edge.x2(), scale*edge.y2() )
-				painter.drawLine( ln )
-
-		for color in self.edgeList:
+		for color, (lines, heads) in edges.items():
 			c = QColor(color[0],color[1],color[2])
 			painter.setPen( c )
-			for edge in self.edgeList[color]:
-				#arrow_scale = .015
-				arrow_scale = 5.0
-				unit_edge = ( edge.x2() - edge.x1(), edge.y2() - edge.y1() )
-				unit_edge_mag = math.sqrt( ( edge.x2() - edge.x1())**2 + ( edge.y2() - edge.y1() )**2 )
-				unit_edge = (unit_edge[0] / unit_edge_mag, unit_edge[1] / unit_edge_mag )
-				unit_edge_perp = (-unit_edge[1], unit_edge[0])
-
-				temp_tform = QTransform()
-				temp_tform.translate(self.width()/2.0,self.height()/2.0)
-				temp_tform.scale(1.0,-1.0)
-				temp_tform.translate(scale*edge.x2(),scale*edge.y2())
-				temp_tform.scale(1.0,-1.0)
-				painter.setTransform(temp_tform)
-				#painter.drawText( RECT, label[1], align )
-
-				tri_pts = []
-				tri_pts.append( QPointF(0,0) )
-				tri_pts.append( QPointF(-arrow_scale*(2*unit_edge[0] + unit_edge_perp[0]),
-										arrow_scale*(2*unit_edge[1] + unit_edge_perp[1])) )
-				tri_pts.append( QPointF(-arrow_scale*(2*unit_edge[0] - unit_edge_perp[0]),
-										arrow_scale*(2*unit_edge[1] - unit_edge_perp[1])) )
-				tri = QPolygonF( tri_pts )
-				b = painter.brush()
-				painter.setBrush( c )
-				painter.drawPolygon( tri )
-				painter.setBrush( b )
-
-		painter.setTransform(tform)
-		font = QFont("Monospace")
+			painter.drawLines( lines )
+			if not heads.isEmpty():
+				painter.fillPath( heads, c )
+
+		# Text is drawn without the y flip, centred on each label's position.
+		if self._showLabels( scale ):
+			painter.resetTransform()
+			R = 1.0E3
+			align = QTextOption(Qt.AlignmentFlag.AlignHCenter | Qt.AlignmentFlag.AlignVCenter )
+			for color, colorLabels in labels.items():
+				painter.setPen( QColor(color[0],color[1],color[2]) )
+				for x, y, text in colorLabels:
+					painter.drawText( QRectF(cx + x - R, cy - y - R, 2.0*R, 2.0*R), text, align )
+			painter.setTransform(tform)
+
+		for color, polygon in points.items():
+			pen = QPen( QColor(color[0],color[1],color[2]) )
+			pen.setWidthF( 2.0*self.CITY_SIZE + 1.0 )	# the old outlined ellipses
+			pen.setCapStyle( Qt.PenCapStyle.RoundCap )
+			painter.setPen( pen )
+			painter.drawPoints( polygon )
+
+
+
+# Runs one solver off the GUI thread.  progress carries the solver's progress events
+# (see TSPSolver.setProgressCallback) and solved its results dictionary, or None if the
+# solver raised; both are delivered on the GUI thread.
+class SolverThread( QThread ):
+	progress = pyqtSignal( object )
+	solved = pyqtSignal( object )
+
+	def __init__( self, solver, method, time_allowance ):
+		super(SolverThread,self).__init__()
+		self.solver = solver
+		self.method = method
+		self.time_allowance = time_allowance
+
+	def run( self ):
+		self.solver.setProgressCallback( self.progress.emit )
+		try:
+			results = getattr( self.solver, self.method )( time_allowance=self.time_allowance )
+		except Exception as e:
+			print( 'Solver failed: {}'.format(e) )
+			results = None
+		finally:
+			self.solver.setProgressCallback( None )
+		self.solved.emit( results )
+
+
+
+# Shows a solver's profile (see TSPProfiler) and lets it be saved as JSON or CSV.
+class ProfileDialog( QDialog ):
+	def __init__( self, parent, profile ):
+		super(ProfileDialog,self).__init__(parent)
+		self.profile = profile
+		self.setWindowTitle('Solver Profile')
+
+		text = QPlainTextEdit( profile.summary() )
+		text.setReadOnly(True)
+		font = QFont('Monospace')
 		font.setStyleHint(QFont.StyleHint.TypeWriter)
+		text.setFont(font)
+		text.setMinimumSize(560, 300)
+		saveButton = QPushButton('Save...')
+		saveButton.clicked.connect(self.saveClicked)
+		closeButton = QPushButton('Close')
+		closeButton.clicked.connect(self.close)
 
-		R = 1.0E3
-		CITY_SIZE = 2.0 # DIAMETER
-		RECT = QRectF(-R,-R,2.0*R,2.0*R)
-		align = QTextOption(Qt.AlignmentFlag.AlignHCenter | Qt.AlignmentFlag.AlignVCenter )
-		for color in self.labelList:
-			c = QColor(color[0],color[1],color[2])
-			painter.setPen( c )
-			for label in self.labelList[color]:
-				temp_tform = QTransform()
-				temp_tform.translate(self.width()/2.0,self.height()/2.0)
-				temp_tform.scale(1.0,-1.0)
-				pt = label[0]
-				xoff = label[2]
-				temp_tform.translate(scale*pt.x()+xoff,scale*pt.y())
-				temp_tform.scale(1.0,-1.0)
-				painter.setTransform(temp_tform)
-				painter.drawText( RECT, label[1], align )
+		vbox = QVBoxLayout()
+		vbox.addWidget(text)
+		h = QHBoxLayout()
+		h.addStretch(1)
+		h.addWidget(saveButton)
+		h.addWidget(closeButton)
+		vbox.addLayout(h)
+		self.setLayout(vbox)
 
-		painter.setTransform(tform)
-		for color in self.pointList:
-			c = QColor(color[0],color[1],color[2])
-			painter.setPen( c )
-			b = painter.brush()
-			painter.setBrush(c)
-			for point in self.pointList[color]:
-				pt = QPointF(scale*point.x(), scale*point.y())
-				painter.drawEllipse( pt, CITY_SIZE, CITY_SIZE)
-			painter.setBrush(b)
+	def saveClicked( self ):
+		path = QFileDialog.getSaveFileName(self, 'Save Profile', 'profile.json',
+										   'JSON (*.json);;CSV (*.csv)')[0]
+		if path:
+			self.profile.save(path)
 
 
 
 class Proj5GUI( QMainWindow ):
 
+	REDRAW_INTERVAL = 250	# milliseconds between tour redraws while a solver is running
+
 	def __init__( self ):
 		super(Proj5GUI,self).__init__()
 
@@ -206,30 +280,26 @@ class Proj5GUI( QMainWindow ):
 		self._MAX_SEED = 1000
 
 		self._scenario = None
+		self._solverThread = None
+		self._pendingSolution = None
 		self.initUI()
 		self.solver = TSPSolver( self.view )
+		self.solver.setCache( ScenarioCache() )	# re-solving a scenario skips the setup
 		self.genParams = {'size':None,'seed':None,'diff':None}
 
+		# New tours arrive faster than they can be drawn, so only the latest one is drawn,
+		# at most once per REDRAW_INTERVAL.
+		self.redrawTimer = QTimer( self )
+		self.redrawTimer.setInterval( self.REDRAW_INTERVAL )
+		self.redrawTimer.timeout.connect( self.redrawSolution )
+
 
 
 	def newPoints(self):
 		# TODO - ERROR CHECKING!!!!
 		seed = int(self.curSeed.text())
-		random.seed( seed )
-
-		ptlist = []
-		RANGE = self.data_range
-		xr = self.data_range['x']
-		yr = self.data_range['y']
 		npoints = int(self.size.text())
-		while len(ptlist) < npoints:
-			x = random.uniform(0.0,1.0)
-			y = random.uniform(0.0,1.0)
-			if True:
-				xval = xr[0] + (xr[1]-xr[0])*x
-				yval = yr[0] + (yr[1]-yr[0])*y
-				ptlist.append( QPointF(xval,yval) )
-		return ptlist
+		return [QPointF(x, y) for x, y in newPoints( npoints, seed, self.data_range )]
 
 	def generateNetwork(self):
 		points = self.newPoints() # uses current rand seed
@@ -268,7 +338,7 @@ class Proj5GUI( QMainWindow ):
 		self.view.repaint()
 
 
-	def displaySolution( self ) :						# what about calling this somehow every time a new bssf is found?
+	def displaySolution( self ) :
 		self.view.clearEdges([(64,64,255)])				# get rid of edge labels but not point labels
 		if self._solution:
 			self.addCities()
@@ -291,11 +361,11 @@ class Proj5GUI( QMainWindow ):
 		self.curSeed.setText( '{}'.format(new_seed) )
 		self.view.repaint()
 
-	def solveClicked(self):								# need to reset display??? and say "processing..." at bottom???
+	def solveClicked(self):
 		self.solver.setupWithScenario(self._scenario)
+		self.solver.setProfiling( self.profileBox.isChecked() )
 
 		max_time = float( self.timeLimit.text() )
-		# TODO - start on a separate thread
 		self.view.clearEdges([(64,64,255)])				# get rid of edge labels but not point labels
 		self.numSolutions.setText( '--' )
 		self.tourCost.setText( '--' )
@@ -304,12 +374,50 @@ class Proj5GUI( QMainWindow ):
 		self.totalStates.setText( '--' )
 		self.prunedStates.setText( '--' )
 		self.statusBar.showMessage('Processing...')
-		#self.view.repaint()
-		#app.processEvents()
-		solve_func = 'self.solver.'+self.ALGORITHMS[self.algDropDown.currentIndex()][1]
-		results = eval(solve_func)(time_allowance=max_time )
+		self.setSolving( True )
+
+		method = self.ALGORITHMS[self.algDropDown.currentIndex()][1]
+		self._solverThread = SolverThread( self.solver, method, max_time )
+		self._solverThread.progress.connect( self.solverProgress )
+		self._solverThread.solved.connect( self.solverFinished )
+		self._pendingSolution = None
+		self.redrawTimer.start()
+		self._solverThread.start()
+
+	def cancelClicked(self):
+		self.solver.cancel()
+		self.cancelButton.setEnabled(False)
+		self.statusBar.showMessage('Cancelling...')
+
+	# Live counters while a solver runs; a new tour is only remembered here and drawn by
+	# redrawSolution.
+	def solverProgress( self, event ):
+		self.solvedIn.setText( '{:6.2f} seconds so far'.format(event['time']) )
+		if 'count' in event:
+			self.numSolutions.setText( '{}'.format(event['count']) )
+		if 'max' in event:
+			self.maxQSize.setText( '{}'.format(event['max']) )
+		if 'total' in event:
+			self.totalStates.setText( '{}'.format(event['total']) )
+		if 'pruned' in event:
+			self.prunedStates.setText( '{}'.format(event['pruned']) )
+		if 'soln' in event:
+			self.tourCost.setText( '{}'.format(event['cost']) )
+			self._pendingSolution = event['soln']
+
+	def redrawSolution( self ):
+		if self._pendingSolution is not None:
+			self._solution, self._pendingSolution = self._pendingSolution, None
+			self.displaySolution()
+
+	def solverFinished( self, results ):
+		self.redrawTimer.stop()
+		self._pendingSolution = None
+		self._solverThread.wait()
+		self._solverThread = None
+		self.setSolving( False )
 		if results:
-			self.statusBar.showMessage('')
+			self.statusBar.showMessage('Cancelled.' if self.solver.cancelled() else '')
 			self.numSolutions.setText( '{}'.format(results['count']) )
 			self.tourCost.setText( '{}'.format(results['cost']) )
 			self.solvedIn.setText( '{:6.6f} seconds'.format(results['time']) )
@@ -322,10 +430,33 @@ class Proj5GUI( QMainWindow ):
 				self.prunedStates.setText( '{}'.format(results['pruned']))
 			#if self._solution:
 			self.displaySolution()
+			if results.get('profile'):
+				ProfileDialog( self, results['profile'] ).show()
 		else:
 			print( 'GOT NULL SOLUTION BACK!!' )		#probably shouldn't ever use this...
+			self.statusBar.showMessage('')
 		self.view.repaint()
-#		app.processEvents()
+
+	# Only one solve at a time, and no new scenario underneath a running one.
+	def setSolving( self, solving ):
+		self.cancelButton.setEnabled( solving )
+		self.solveButton.setEnabled( not solving )
+		self.randSeedButton.setEnabled( not solving )
+		self.size.setEnabled( not solving )
+		self.curSeed.setEnabled( not solving )
+		self.diffDropDown.setEnabled( not solving )
+		self.algDropDown.setEnabled( not solving )
+		self.profileBox.setEnabled( not solving )
+		if solving:
+			self.generateButton.setEnabled( False )
+		else:
+			self.checkGenInputs()
+
+	def closeEvent( self, event ):
+		if self._solverThread is not None:
+			self.solver.cancel()
+			self._solverThread.wait()
+		super(Proj5GUI,self).closeEvent( event )
 
 	def checkGenInputs(self):
 		seed  = self.curSeed.text()
@@ -370,12 +501,7 @@ class Proj5GUI( QMainWindow ):
 
 		return '' if retval==None else retval
 
-	ALGORITHMS = [ \
-		('Default                            ','defaultRandomTour'), \
-		('Greedy','greedy'), \
-		('Branch and Bound','branchAndBound'), \
-		('Fancy','fancy') \
-	]															# whitespace hack to get longest to display correctly
+	ALGORITHMS = ALGORITHMS
 
 	def initUI( self ):
 		self.setWindowTitle('Traveling Salesperson Problem')
@@ -398,6 +524,8 @@ class Proj5GUI( QMainWindow ):
 		self.randSeedButton = QPushButton('Randomize Seed')
 		self.generateButton = QPushButton('Generate Scenario')
 		self.solveButton	= QPushButton('Solve TSP')
+		self.cancelButton	= QPushButton('Cancel')
+		self.profileBox		= QCheckBox('Profile')
 
 		self.curSeed		= QLineEdit('20')
 		self.curSeed.setFixedWidth(100)
@@ -466,6 +594,8 @@ class Proj5GUI( QMainWindow ):
 		h.addWidget( self.timeLimit )
 		h.addWidget( QLabel( 'seconds' ) )
 		h.addWidget( self.solveButton )
+		h.addWidget( self.cancelButton )
+		h.addWidget( self.profileBox )
 		h.addStretch(1)
 		vbox.addLayout(h)
 
@@ -485,6 +615,7 @@ class Proj5GUI( QMainWindow ):
 
 		self.lastPath = (None,None)
 		self.solveButton.setEnabled(False)
+		self.cancelButton.setEnabled(False)
 
 		self.curSeed.textChanged.connect(self.checkGenInputs)
 		self.size.textChanged.connect(self.checkGenInputs)
@@ -492,6 +623,7 @@ class Proj5GUI( QMainWindow ):
 		self.randSeedButton.clicked.connect(self.randSeedClicked)
 		self.generateButton.clicked.connect(self.generateClicked)
 		self.solveButton.clicked.connect(self.solveClicked)
+		self.cancelButton.clicked.connect(self.cancelClicked)
 
 		self.diffDropDown.addItem('Easy                               ')					# Weird hack to make box wide enough to show all of last item
 		self.diffDropDown.addItem('Normal')
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+
+# Batch solving: runs many (size, seed, difficulty, algorithm, time) specs on a pool of
+# worker processes and hands back each results dictionary as soon as its solve finishes.
+#
+#   for spec, results in solveBatch( specs ):
+#       print( spec['algorithm'], results['cost'] )
+#
+# The parent process generates each scenario once, however many specs use it, and puts
+# its cost matrix in a shared memory block that the workers map instead of receiving a
+# pickled copy.  A block is freed once the last spec using it has finished.  Scenarios
+# over Scenario.DENSE_EDGE_LIMIT cities have no matrix, so workers just regenerate them.
+#
+# From the command line, the product of the given sizes, difficulties, seeds and
+# algorithms is solved and each result printed as one line of JSON (as Proj5CLI does):
+#
+#   python3 TSPBatch.py --sizes 20 50 --seeds $(seq 0 99) --algorithms greedy fancy --time 5
+
+import argparse
+import concurrent.futures
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+
+import numpy as np
+from multiprocessing import shared_memory
+
+from TSPClasses import DIFFICULTIES, IndexedTSPSolution, Scenario, newPoints
+
+
+DEFAULT_TIME = 60.0
+
+
+def _scenarioKey( spec ):
+	return (spec['size'], spec['seed'], spec['difficulty'], spec.get('thin_version'))
+
+
+# The same scenario Proj5CLI and TSPBenchmark make for a spec, and the GUI too except in
+# 'Hard' mode, whose thinning the GUI leaves unseeded.
+def makeScenario( spec ):
+	np.random.seed( spec['seed'] )	# Hard mode thinning
+	points = newPoints( spec['size'], spec['seed'] )
+	return Scenario( city_locations=points, difficulty=spec['difficulty'], rand_seed=spec['seed'],
+					 thin_version=spec.get('thin_version') )
+
+
+# A scenario generated in the parent, with its cost matrix in a shared memory block.
+# share() is what a worker needs to rebuild it: the parameters, the coordinates and the
+# block's name (None for a scenario without a matrix, which workers regenerate).
+class _SharedScenario:
+	def __init__( self, spec ):
+		self.scenario = makeScenario( spec )
+		self.pending = 0
+		self.memory = None
+		ncities = len( self.scenario.getCities() )
+		if ncities > Scenario.DENSE_EDGE_LIMIT:
+			return
+		matrix = self.scenario.getCostMatrix()
+		self.memory = shared_memory.SharedMemory( create=True, size=max(matrix.nbytes, 1) )
+		shared = np.ndarray( matrix.shape, dtype=matrix.dtype, buffer=self.memory.buf )
+		shared[:] = matrix
+		shared.flags.writeable = False
+		self.scenario._cost_matrix = shared
+
+	def share( self ):
+		if self.memory is None:
+			return None
+		return (self.scenario.params(), [array.tolist() for array in self.scenario.coordinates()], self.memory.name)
+
+	# Detach the scenario from the block (its solutions fall back to Scenario.pairCosts)
+	# and free it.
+	def release( self ):
+		if self.memory is None:
+			return
+		self.scenario._cost_matrix = None
+		self.memory.close()
+		self.memory.unlink()
+		self.memory = None
+
+
+# Runs in a worker process.  The tour comes back as an index array rather than a
+# TSPSolution, which would drag the whole scenario through pickle.
+def _solve( spec, shared ):
+	if shared is None:
+		return _run( spec, makeScenario(spec) )
+	params, (xs, ys, elevations), name = shared
+	memory = shared_memory.SharedMemory( name=name )	# the parent owns (and unlinks) the block
+	try:
+		matrix = np.ndarray( (len(xs), len(xs)), dtype=float, buffer=memory.buf )
+		return _run( spec, Scenario.fromArrays(params, xs, ys, elevations, None, matrix) )
+	finally:
+		matrix = None
+		try:
+			memory.close()
+		except BufferError:		# still referenced from a traceback; it goes with that
+			pass
+
+def _run( spec, scenario ):
+	from TSPSolver import TSPSolver
+
+	np.random.seed( spec['seed'] )	# the randomized solvers
+	solver = TSPSolver( None )
+	solver.setupWithScenario( scenario )
+	results = getattr( solver, spec['algorithm'] )( time_allowance=spec.get('time', DEFAULT_TIME) )
+	soln = results.get( 'soln' )
+	if isinstance( soln, IndexedTSPSolution ):
+		results['soln'] = np.array( soln.order )
+	elif soln is not None:
+		results['soln'] = np.array( [city._index for city in soln.route] )
+	return results
+
+
+''' <summary>
+	Solves every spec (a dict with 'size', 'seed', 'difficulty' and 'algorithm', the name
+	of a TSPSolver method, plus optionally 'time', the time allowance, and 'thin_version')
+	on workers processes (one per CPU by default).  Specs are started in order, at most
+	workers * 2 at a time, so scenarios shared by neighbouring specs are generated once and
+	only a few are held in memory however long the batch.
+	</summary>
+	<returns>a generator of (spec, results) in the order the solves finish.  results is
+	the solver's results dictionary, with 'soln' a TSPSolution of the parent's copy of the
+	scenario, or {'error': message} if the solve raised.</returns>
+'''
+def solveBatch( specs, workers=None ):
+	workers = workers or os.cpu_count() or 1
+	specs = iter( specs )
+	scenarios = {}		# scenario key -> _SharedScenario, while specs still need it
+	running = {}		# future -> (spec, _SharedScenario)
+	with concurrent.futures.ProcessPoolExecutor( max_workers=workers,
+												 mp_context=multiprocessing.get_context() ) as pool:
+		try:
+			while True:
+				for spec in itertools.islice( specs, 2 * workers - len(running) ):
+					key = _scenarioKey( spec )
+					shared = scenarios.get( key )
+					if shared is None:
+						shared = scenarios[key] = _SharedScenario( spec )
+					shared.pending += 1
+					running[pool.submit( _solve, spec, shared.share() )] = (spec, shared)
+				if not running:
+					return
+
+				done, _ = concurrent.futures.wait( running, return_when=concurrent.futures.FIRST_COMPLETED )
+				for future in done:
+					spec, shared = running.pop( future )
+					try:
+						results = future.result()
+						if results.get( 'soln' ) is not None:
+							results['soln'] = IndexedTSPSolution( shared.scenario, results['soln'] )
+					except Exception as e:
+						results = {'error': '{}: {}'.format(type(e).__name__, e)}
+					shared.pending -= 1
+					if shared.pending == 0:
+						shared.release()
+						del scenarios[_scenarioKey(spec)]
+					yield spec, results
+		finally:
+			for future in running:
+				future.cancel()
+			pool.shutdown( wait=True )
+			for shared in scenarios.values():
+				shared.release()
+
+
+def main( argv=None ):
+	from Proj5CLI import jsonable, solverMethod
+
+	parser = argparse.ArgumentParser( description='Solve many scenarios in parallel.' )
+	parser.add_argument( '--sizes', type=int, nargs='+', required=True )
+	parser.add_argument( '--difficulties', nargs='+', choices=DIFFICULTIES, default=['Hard (Deterministic)'] )
+	parser.add_argument( '--seeds', type=int, nargs='+', default=[0] )
+	parser.add_argument( '--algorithms', type=solverMethod, nargs='+', default=['greedy'] )
+	parser.add_argument( '--time', type=float, default=DEFAULT_TIME, help='time allowance per solve, in seconds' )
+	parser.add_argument( '--workers', type=int, help='worker processes (default: one per CPU)' )
+	args = parser.parse_args( argv )
+
+	specs = ({'size': size, 'difficulty': difficulty, 'seed': seed, 'algorithm': algorithm, 'time': args.time}
+			 for size, difficulty, seed, algorithm
+			 in itertools.product( args.sizes, args.difficulties, args.seeds, args.algorithms ))
+	for spec, results in solveBatch( specs, args.workers ):
+		record = {key: value for key, value in spec.items() if key != 'time'}	# 'time' is the solve time below
+		record.update( jsonable(results) )
+		print( json.dumps(record), flush=True )
+	return 0
+
+
+if __name__ == '__main__':
+	sys.exit( main() )
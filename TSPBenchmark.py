@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+
+# Benchmark harness: runs every combination of size x difficulty x seed x algorithm,
+# records the solver's results (plus memory use) in a JSON file, and optionally compares
+# them against an earlier run to flag regressions in running time or tour cost.
+#
+#   python3 TSPBenchmark.py --sizes 10 15 20 --seeds 0 1 2 --output new.json --baseline old.json
+#
+# Each solve runs in a fresh process, so its peak memory is its own and one solver's
+# caches or garbage can't slow down the next.  The exit status is 1 if any regression
+# was found, so the script can gate a change.
+
+import argparse
+import datetime
+import itertools
+import json
+import math
+import multiprocessing
+import platform
+import resource
+import sys
+import time
+
+from TSPClasses import DIFFICULTIES, Scenario, newPoints
+
+
+DEFAULT_ALGORITHMS = ['defaultRandomTour', 'greedy', 'branchAndBound', 'fancy']
+RESULT_FIELDS = ['cost', 'time', 'count', 'max', 'total', 'pruned']
+
+TIME_TOLERANCE = 0.25	# flag runs more than 25% slower than the baseline...
+MIN_TIME_CHANGE = 0.05	# ...unless they are slower by less than this many seconds (timer noise)
+COST_TOLERANCE = 0.0	# flag any tour that costs more than the baseline's
+
+
+# ru_maxrss is in kilobytes on Linux but in bytes on macOS.
+def _peakRSS():
+	peak = resource.getrusage( resource.RUSAGE_SELF ).ru_maxrss
+	return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _number( value ):
+	if value is None:
+		return None
+	value = float( value )
+	if not math.isfinite( value ):
+		return None
+	return int(value) if value.is_integer() else value
+
+
+# Runs in the child process: builds the scenario, solves it and sends back the record.
+def _runJob( conn, job, time_allowance ):
+	import numpy as np
+	from TSPSolver import TSPSolver
+
+	try:
+		np.random.seed( job['seed'] )	# Hard mode thinning and the randomized solvers
+		points = newPoints( job['size'], job['seed'] )
+		scenario = Scenario( city_locations=points, difficulty=job['difficulty'], rand_seed=job['seed'] )
+		if job['size'] <= Scenario.DENSE_EDGE_LIMIT:	# bigger ones are solved without the matrix
+			scenario.getCostMatrix()
+		before = _peakRSS()
+
+		solver = TSPSolver( None )
+		solver.setupWithScenario( scenario )
+		results = getattr( solver, job['algorithm'] )( time_allowance=time_allowance )
+
+		record = dict( job )
+		for field in RESULT_FIELDS:
+			record[field] = _number( results.get(field) )
+		record['peak_rss'] = _peakRSS()
+		record['solve_rss'] = record['peak_rss'] - before
+		conn.send( record )
+	except Exception as e:
+		conn.send( dict(job, error='{}: {}'.format(type(e).__name__, e)) )
+	finally:
+		conn.close()
+
+
+def runJob( job, time_allowance ):
+	context = multiprocessing.get_context( 'spawn' )
+	parent, child = context.Pipe( duplex=False )
+	process = context.Process( target=_runJob, args=(child, job, time_allowance) )
+	process.start()
+	child.close()
+	try:
+		record = parent.recv()
+	except EOFError:	# the child died without reporting (killed, out of memory, ...)
+		record = dict( job, error='worker exited with code {}'.format(process.exitcode) )
+	process.join()
+	return record
+
+
+def runSuite( sizes, difficulties, seeds, algorithms, time_allowance, log=None ):
+	runs = []
+	for size, difficulty, seed, algorithm in itertools.product( sizes, difficulties, seeds, algorithms ):
+		job = {'algorithm': algorithm, 'difficulty': difficulty, 'size': size, 'seed': seed}
+		record = runJob( job, time_allowance )
+		runs.append( record )
+		if log:
+			log( formatRun(record) )
+	return runs
+
+
+def formatRun( record ):
+	name = '{algorithm:>18} {difficulty:>20} n={size:<4} seed={seed:<4}'.format( **record )
+	if 'error' in record:
+		return '{}  ERROR {}'.format( name, record['error'] )
+	return '{}  cost={}  time={:.3f}s  peak={:.1f}MB'.format(
+		name, record['cost'], record['time'], record['peak_rss'] / 2**20 )
+
+
+def _key( record ):
+	return (record['algorithm'], record['difficulty'], record['size'], record['seed'])
+
+
+''' <summary>
+	Compares each run with the baseline run of the same algorithm, difficulty, size and
+	seed.  A run regresses if it fails where the baseline didn't, finds a costlier tour
+	(beyond cost_tolerance), or takes longer by more than both time_tolerance (a fraction)
+	and min_time_change seconds.  Runs missing from the baseline are skipped.
+	</summary>
+	<returns>list of (record, baseline record, list of reasons) for each regression</returns>
+'''
+def compare( runs, baseline, time_tolerance=TIME_TOLERANCE, cost_tolerance=COST_TOLERANCE,
+			 min_time_change=MIN_TIME_CHANGE ):
+	previous = {_key(record): record for record in baseline}
+	regressions = []
+	for record in runs:
+		base = previous.get( _key(record) )
+		if base is None or 'error' in base:
+			continue
+		if 'error' in record:
+			regressions.append( (record, base, [record['error']]) )
+			continue
+
+		reasons = []
+		if base['cost'] is not None:
+			if record['cost'] is None:
+				reasons.append( 'no tour found (baseline cost {})'.format(base['cost']) )
+			elif record['cost'] > base['cost'] * (1.0 + cost_tolerance):
+				reasons.append( 'cost {} > {}'.format(record['cost'], base['cost']) )
+		slower = record['time'] - base['time']
+		if slower > min_time_change and record['time'] > base['time'] * (1.0 + time_tolerance):
+			reasons.append( 'time {:.3f}s > {:.3f}s'.format(record['time'], base['time']) )
+		if reasons:
+			regressions.append( (record, base, reasons) )
+	return regressions
+
+
+def main( argv=None ):
+	parser = argparse.ArgumentParser( description='Benchmark the TSP solvers.' )
+	parser.add_argument( '--sizes', type=int, nargs='+', default=[10, 15, 20] )
+	parser.add_argument( '--difficulties', nargs='+', choices=DIFFICULTIES, default=list(DIFFICULTIES) )
+	parser.add_argument( '--seeds', type=int, nargs='+', default=[0, 1, 2] )
+	parser.add_argument( '--algorithms', nargs='+', default=DEFAULT_ALGORITHMS )
+	parser.add_argument( '--time', type=float, default=60.0, help='time allowance per solve, in seconds' )
+	parser.add_argument( '--output', help='write the results to this JSON file' )
+	parser.add_argument( '--baseline', help='JSON file from an earlier run to compare against' )
+	parser.add_argument( '--time-tolerance', type=float, default=TIME_TOLERANCE )
+	parser.add_argument( '--cost-tolerance', type=float, default=COST_TOLERANCE )
+	parser.add_argument( '--min-time-change', type=float, default=MIN_TIME_CHANGE )
+	args = parser.parse_args( argv )
+
+	import numpy as np
+	started = time.time()
+	runs = runSuite( args.sizes, args.difficulties, args.seeds, args.algorithms, args.time, log=print )
+	report = {
+		'meta': {
+			'date': datetime.datetime.now().isoformat( timespec='seconds' ),
+			'elapsed': time.time() - started,
+			'time_allowance': args.time,
+			'python': platform.python_version(),
+			'numpy': np.__version__,
+			'machine': platform.platform(),
+		},
+		'runs': runs,
+	}
+	if args.output:
+		with open( args.output, 'w' ) as f:
+			json.dump( report, f, indent=1 )
+
+	if not args.baseline:
+		return 0
+	with open( args.baseline ) as f:
+		baseline = json.load( f )['runs']
+	regressions = compare( runs, baseline, args.time_tolerance, args.cost_tolerance, args.min_time_change )
+	for record, base, reasons in regressions:
+		print( 'REGRESSION {}: {}'.format( formatRun(record), '; '.join(reasons) ) )
+	print( '{} of {} runs regressed'.format( len(regressions), len(runs) ) )
+	return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+	sys.exit( main() )
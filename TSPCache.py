@@ -0,0 +1,89 @@
+#!/usr/bin/python3
+
+import collections
+import hashlib
+import threading
+
+import numpy as np
+
+
+
+''' <summary>
+	Keeps the expensive per-scenario setup between solves (see TSPSolver.setCache): the
+	raw cost matrix, the reduced root matrix with its lower bound, and the best tour found
+	so far.  Scenarios are identified by their generation parameters plus a fingerprint
+	of their cities and edges, so regenerating the same scenario (or loading it from a
+	file) finds the same entries.  Items are evicted least recently used first once their
+	arrays take more than max_bytes.
+	</summary>
+'''
+class ScenarioCache:
+	DEFAULT_MAX_BYTES = 512 * 1024**2
+
+	def __init__( self, max_bytes=DEFAULT_MAX_BYTES ):
+		self.max_bytes = max_bytes
+		self.nbytes = 0
+		self._items = collections.OrderedDict()	# (scenario key, item) -> (value, nbytes)
+		self._hits = collections.Counter()
+		self._misses = collections.Counter()
+		self._evictions = 0
+		self._lock = threading.Lock()
+
+	# Identity of a scenario: (size, seed, difficulty, fingerprint), computed once per
+	# Scenario object.  The fingerprint covers coordinates, elevations and the edge mask,
+	# so scenarios that merely share a seed (Hard mode thins edges at random) differ.
+	@staticmethod
+	def key( scenario ):
+		key = getattr( scenario, '_cacheKey', None )
+		if key is None:
+			cities = scenario.getCities()
+			digest = hashlib.sha1()
+			digest.update( np.array([(c._x, c._y, c._elevation) for c in cities], dtype='<f8').tobytes() )
+			scenario.digestEdges( digest )
+			key = (len(cities), scenario._rand_seed, scenario._difficulty, digest.hexdigest())
+			scenario._cacheKey = key
+		return key
+
+	def get( self, scenario, item ):
+		entry = (self.key(scenario), item)
+		with self._lock:
+			found = self._items.get( entry )
+			if found is None:
+				self._misses[item] += 1
+				return None
+			self._items.move_to_end( entry )
+			self._hits[item] += 1
+			return found[0]
+
+	# Like get, but without counting a hit or miss or refreshing the item.
+	def peek( self, scenario, item ):
+		with self._lock:
+			found = self._items.get( (self.key(scenario), item) )
+			return None if found is None else found[0]
+
+	# Store value (counted as nbytes against the budget), replacing any earlier one.
+	# Values bigger than the whole budget are not kept.
+	def put( self, scenario, item, value, nbytes=0 ):
+		entry = (self.key(scenario), item)
+		with self._lock:
+			old = self._items.pop( entry, None )
+			if old is not None:
+				self.nbytes -= old[1]
+			if nbytes > self.max_bytes:
+				return
+			self._items[entry] = (value, nbytes)
+			self.nbytes += nbytes
+			while self.nbytes > self.max_bytes:
+				_, (_, evicted) = self._items.popitem( last=False )
+				self.nbytes -= evicted
+				self._evictions += 1
+
+	def clear( self ):
+		with self._lock:
+			self._items.clear()
+			self.nbytes = 0
+
+	def stats( self ):
+		with self._lock:
+			return {'hits': dict(self._hits), 'misses': dict(self._misses),
+					'evictions': self._evictions, 'items': len(self._items), 'bytes': self.nbytes}
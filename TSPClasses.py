@@ -1,6 +1,8 @@
 #!/usr/bin/python3
 
 
+import hashlib
+import json
 import math
 import numpy as np
 import random
@@ -14,29 +16,86 @@ class TSPSolution:
 		self.cost = self._costOfRoute()
 		#print( [c._index for c in listOfCities] )
 
+	# Costs of every edge of the tour (including the closing edge back to the start).
+	def _edgeCosts( self ):
+		order = np.array( [c._index for c in self.route] )
+		return self.route[0]._scenario.edgeCosts( order, np.roll(order, -1) )
+
 	def _costOfRoute( self ):
-		cost = 0
-		last = self.route[0]
-		for city in self.route[1:]:
-			cost += last.costTo(city)
-			last = city
-		cost += self.route[-1].costTo( self.route[0] )
-		return cost
+		cost = self._edgeCosts().sum()
+		return math.inf if cost == np.inf else int(cost)
+
+	def enumerateEdges( self ):
+		dists = self._edgeCosts()
+		if np.isinf(dists).any():
+			return None
+		nxt = self.route[1:] + self.route[:1]
+		return [(c1, c2, int(dist)) for c1, c2, dist in zip(self.route, nxt, dists)]
+
+
+# Same interface as TSPSolution, but the tour is held as an array of city indices into
+# the scenario, so building and scoring one costs a single gather over the cost matrix.
+# The list of City objects the GUI wants is only built if route is actually read.
+class IndexedTSPSolution(TSPSolution):
+	def __init__( self, scenario, order ):
+		self._scenario = scenario
+		self.order = np.array(order, dtype=np.intp)
+		self.order.setflags(write=False)
+		self._route = None
+		self.cost = self._costOfRoute()
+
+	@property
+	def route( self ):
+		if self._route is None:
+			cities = self._scenario.getCities()
+			self._route = [cities[i] for i in self.order]
+		return self._route
+
+	# Cost of every tour in orders (one tour, or a 2-D array with one tour per row),
+	# with inf for tours that use a missing edge.
+	@staticmethod
+	def tourCosts( matrix, orders ):
+		orders = np.asarray(orders)
+		return matrix[orders, np.roll(orders, -1, axis=-1)].sum(axis=-1)
+
+	def _edgeCosts( self ):
+		return self._scenario.edgeCosts( self.order, np.roll(self.order, -1) )
+
+	# Index pairs (from, to) and costs of the tour's edges, without touching any City.
+	def edgeArrays( self ):
+		return self.order, np.roll(self.order, -1), self._edgeCosts()
 
 	def enumerateEdges( self ):
-		elist = []
-		c1 = self.route[0]
-		for c2 in self.route[1:]:
-			dist = c1.costTo( c2 )
-			if dist == np.inf:
-				return None
-			elist.append( (c1, c2, int(math.ceil(dist))) )
-			c1 = c2
-		dist = self.route[-1].costTo( self.route[0] )
-		if dist == np.inf:
+		src, dst, dists = self.edgeArrays()
+		if np.isinf(dists).any():
 			return None
-		elist.append( (self.route[-1], self.route[0], int(math.ceil(dist))) )
-		return elist
+		cities = self._scenario.getCities()
+		return [(cities[i], cities[j], int(dist)) for i, j, dist in zip(src.tolist(), dst.tolist(), dists.tolist())]
+
+
+DIFFICULTIES = ('Easy', 'Normal', 'Hard', 'Hard (Deterministic)')
+DATA_RANGE = { 'x':[-1.5,1.5], 'y':[-1.0,1.0] }
+
+# City locations may be given as (x, y) pairs or as QPointF-like objects with x() and y().
+def pointCoordinates( pt ):
+	if callable( getattr(pt, 'x', None) ):
+		return pt.x(), pt.y()
+	x, y = pt
+	return x, y
+
+# Random city locations for a given seed: the same points the GUI generates for that
+# seed, as (x, y) pairs.  The random module is left where the GUI leaves it, so the
+# elevations Scenario then draws in Normal and Hard mode match too.
+def newPoints( npoints, seed, data_range=DATA_RANGE ):
+	random.seed( seed )
+	xr = data_range['x']
+	yr = data_range['y']
+	ptlist = []
+	while len(ptlist) < npoints:
+		x = random.uniform(0.0,1.0)
+		y = random.uniform(0.0,1.0)
+		ptlist.append( (xr[0] + (xr[1]-xr[0])*x, yr[0] + (yr[1]-yr[0])*y) )
+	return ptlist
 
 
 def nameForInt( num ):
@@ -57,21 +116,29 @@ def nameForInt( num ):
 class Scenario:
 
 	HARD_MODE_FRACTION_TO_REMOVE = 0.20 # Remove 20% of the edges
-
-	def __init__( self, city_locations, difficulty, rand_seed ):
+	THIN_VERSION = 2 # Edge thinning algorithm used by default; 1 reproduces the original graphs
+	LAZY_EDGE_VERSION = 3 # Edges decided on demand by hashing; no n x n mask is ever stored
+	DENSE_EDGE_LIMIT = 5000 # Bigger scenarios default to LAZY_EDGE_VERSION
+
+	def __init__( self, city_locations, difficulty, rand_seed, thin_version=None ):
+		city_locations = [pointCoordinates(pt) for pt in city_locations]
+		if thin_version is None:
+			thin_version = self.THIN_VERSION if len(city_locations) <= self.DENSE_EDGE_LIMIT else self.LAZY_EDGE_VERSION
 		self._difficulty = difficulty
+		self._rand_seed = rand_seed
+		self._thin_version = thin_version
 
 		if difficulty == "Normal" or difficulty == "Hard":
-			self._cities = [City( pt.x(), pt.y(), \
+			self._cities = [City( x, y, \
 								  random.uniform(0.0,1.0) \
-								) for pt in city_locations]
+								) for x, y in city_locations]
 		elif difficulty == "Hard (Deterministic)":
 			random.seed( rand_seed )
-			self._cities = [City( pt.x(), pt.y(), \
+			self._cities = [City( x, y, \
 								  random.uniform(0.0,1.0) \
-								) for pt in city_locations]
+								) for x, y in city_locations]
 		else:
-			self._cities = [City( pt.x(), pt.y() ) for pt in city_locations]
+			self._cities = [City( x, y ) for x, y in city_locations]
 
 
 		num = 0
@@ -83,16 +150,263 @@ class Scenario:
 
 		# Assume all edges exists except self-edges
 		ncities = len(self._cities)
-		self._edge_exists = ( np.ones((ncities,ncities)) - np.diag( np.ones((ncities)) ) ) > 0
+		self._coordinates = None
+		self._edgeSeed, self._keepNext, self._removeFraction = 0, None, 0.0
+		if thin_version == self.LAZY_EDGE_VERSION:
+			self._edge_exists = None
+		else:
+			self._edge_exists = ~np.eye( ncities, dtype=bool )
 
 		if difficulty == "Hard":
-			self.thinEdges()
+			self.thinEdges(version=thin_version)
 		elif difficulty == "Hard (Deterministic)":
-			self.thinEdges(deterministic=True)
+			self.thinEdges(deterministic=True, version=thin_version)
+
+		self._cost_matrix = None
 
 	def getCities( self ):
 		return self._cities
 
+	''' <summary>
+		The full asymmetric cost matrix: entry [i,j] is what City.costTo would return
+		for cities i and j (np.inf for self-edges and edges removed in hard mode).
+		It is built once, on first use, and handed out read-only so solvers can share it;
+		copy it before modifying.
+		</summary> '''
+	def getCostMatrix( self ):
+		if self._cost_matrix is None:
+			self._cost_matrix = self._buildCostMatrix()
+		return self._cost_matrix
+
+	def _buildCostMatrix( self ):
+		xs, ys, elevations = self.coordinates()
+
+		# Euclidean Distance, with rows as the source city and columns as the destination
+		matrix = np.sqrt( (xs[np.newaxis,:] - xs[:,np.newaxis])**2 +
+						  (ys[np.newaxis,:] - ys[:,np.newaxis])**2 )
+
+		# For Medium and Hard modes, add in the asymmetric elevation cost (never below zero)
+		if not self._difficulty == 'Easy':
+			matrix += elevations[np.newaxis,:] - elevations[:,np.newaxis]
+			np.maximum( matrix, 0.0, out=matrix )
+
+		matrix = np.ceil( matrix * City.MAP_SCALE )
+		matrix[~self.getEdgeMask()] = np.inf
+		matrix.flags.writeable = False
+		return matrix
+
+	# Costs of the edges src[k] -> dst[k], read from the cost matrix (built on first use).
+	# Lazy-edge scenarios compute them with pairCosts instead and never need the matrix.
+	def edgeCosts( self, src, dst ):
+		if self._cost_matrix is not None or self._edge_exists is not None:
+			return self.getCostMatrix()[src, dst]
+		return self.pairCosts( src, dst )
+
+	# The cities' x, y and elevation as three read-only arrays.
+	def coordinates( self ):
+		if self._coordinates is None:
+			self._coordinates = tuple( np.array( [getattr(c, name) for c in self._cities], dtype=float )
+									   for name in ('_x', '_y', '_elevation') )
+			for array in self._coordinates:
+				array.flags.writeable = False
+		return self._coordinates
+
+	''' <summary>
+		Costs of the edges src[k] -> dst[k] (index arrays of any matching shape), equal to
+		the corresponding cost matrix entries but computed without building the matrix.
+		</summary> '''
+	def pairCosts( self, src, dst ):
+		xs, ys, elevations = self.coordinates()
+		src, dst = np.asarray( src ), np.asarray( dst )
+		costs = np.sqrt( (xs[dst] - xs[src])**2 + (ys[dst] - ys[src])**2 )
+		if not self._difficulty == 'Easy':
+			costs = np.maximum( costs + (elevations[dst] - elevations[src]), 0.0 )
+		return np.where( self.edgeExists( src, dst ), np.ceil( costs * City.MAP_SCALE ), np.inf )
+
+	''' <summary>
+		Whether the edges src[k] -> dst[k] exist.  With lazy edges (LAZY_EDGE_VERSION)
+		this is decided from a hash of the edge, so it costs the same for any size.
+		</summary> '''
+	def edgeExists( self, src, dst ):
+		if self._edge_exists is not None:
+			return self._edge_exists[src, dst]
+		src, dst = np.asarray( src ), np.asarray( dst )
+		exists = src != dst
+		if self._removeFraction > 0.0:
+			removed = self._edgeHash( src, dst ) < self._removeFraction
+			removed &= self._keepNext[src] != dst
+			exists &= ~removed
+		return exists
+
+	# edgeExists for a single edge, in plain Python (for the solvers' inner loops, where
+	# numpy's per-call overhead would dominate).
+	def edgeExistsPair( self, src, dst ):
+		if self._edge_exists is not None:
+			return bool( self._edge_exists[src, dst] )
+		if src == dst:
+			return False
+		if self._removeFraction <= 0.0 or self._keepNext[src] == dst:
+			return True
+		z = (int(src) * len(self._cities) + int(dst) + int(self._edgeSeed) + 0x9E3779B97F4A7C15) & self._MASK64
+		z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & self._MASK64
+		z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & self._MASK64
+		z ^= z >> 31
+		return (z >> 11) * (1.0 / 2**53) >= self._removeFraction
+
+	# The full n x n edge mask (built on every call when edges are lazy).
+	def getEdgeMask( self ):
+		if self._edge_exists is not None:
+			return self._edge_exists
+		ncities = len(self._cities)
+		cities = np.arange( ncities )
+		return self.edgeExists( cities[:, np.newaxis], cities[np.newaxis, :] )
+
+	# Feeds whatever determines the edges into a hashlib digest.
+	def digestEdges( self, digest ):
+		if self._edge_exists is not None:
+			digest.update( np.packbits( self._edge_exists, axis=None ).tobytes() )
+		else:
+			digest.update( repr( (self._edgeSeed, self._removeFraction) ).encode() )
+			if self._keepNext is not None:
+				digest.update( self._keepNext.tobytes() )
+
+	# Uniform [0,1) value per edge: the splitmix64 finalizer applied to the edge's index
+	# and the scenario's edge seed.
+	_MASK64 = (1 << 64) - 1
+	def _edgeHash( self, src, dst ):
+		with np.errstate( over='ignore' ):
+			z = src.astype( np.uint64 ) * np.uint64( len(self._cities) ) + dst.astype( np.uint64 )
+			z = z + np.uint64( (self._edgeSeed + 0x9E3779B97F4A7C15) & self._MASK64 )
+			z = (z ^ (z >> np.uint64(30))) * np.uint64( 0xBF58476D1CE4E5B9 )
+			z = (z ^ (z >> np.uint64(27))) * np.uint64( 0x94D049BB133111EB )
+			z = z ^ (z >> np.uint64(31))
+		return (z >> np.uint64(11)) * (1.0 / 2**53)
+
+	''' <summary>
+		Binary scenario files.  The file is FILE_MAGIC, the length of a JSON header as a
+		little-endian uint64, the header, and then the raw arrays, each starting on a
+		FILE_ALIGN boundary so the cost matrix can be memory-mapped straight into solvers:
+		processes that load the same file share one copy of it in the page cache.  The
+		header holds the generation parameters, the arrays' dtypes, shapes and offsets,
+		and a SHA-256 checksum over the rest of the header and the array bytes.  Format 2
+		stores the edge mask unpacked, one byte per edge, so it is mapped and shared like
+		the cost matrix; format 1 files (bit-packed mask, checksum over the arrays only)
+		still load.
+		</summary> '''
+	FILE_MAGIC = b'TSPSCN01'
+	FILE_ALIGN = 4096
+	FILE_FORMAT = 2
+	_FILE_CHUNK = 2**24
+
+	def params( self ):
+		return {'size': len(self._cities), 'seed': self._rand_seed,
+				'difficulty': self._difficulty, 'thin_version': self._thin_version}
+
+	def save( self, path ):
+		arrays = [
+			('x', np.array( [c._x for c in self._cities], dtype='<f8' )),
+			('y', np.array( [c._y for c in self._cities], dtype='<f8' )),
+			('elevation', np.array( [c._elevation for c in self._cities], dtype='<f8' )),
+			('edge_exists', np.asarray( self.getEdgeMask(), dtype=bool )),
+			('cost_matrix', np.asarray( self.getCostMatrix(), dtype='<f8' )),
+		]
+		header = {'format': self.FILE_FORMAT, 'params': self.params(), 'arrays': {}}
+		offset = 0
+		for name, array in arrays:
+			header['arrays'][name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+			offset += -(-array.nbytes // self.FILE_ALIGN) * self.FILE_ALIGN
+		checksum = self._hashHeader( header )
+		for name, array in arrays:
+			self._hashArray( checksum, array )
+		header['sha256'] = checksum.hexdigest()
+
+		headerBytes = json.dumps( header ).encode( 'utf-8' )
+		start = -(-(len(self.FILE_MAGIC) + 8 + len(headerBytes)) // self.FILE_ALIGN) * self.FILE_ALIGN
+		with open( path, 'wb' ) as f:
+			f.write( self.FILE_MAGIC )
+			f.write( np.uint64(len(headerBytes)).astype('<u8').tobytes() )
+			f.write( headerBytes )
+			for name, array in arrays:
+				f.seek( start + header['arrays'][name]['offset'] )
+				f.write( np.ascontiguousarray(array).data )
+			f.truncate( start + offset )
+
+	''' <summary>
+		Reads a scenario written by save().  With mmap the cost matrix and (from format 2)
+		the edge mask are read-only memory maps of the file (nothing is read until it is
+		used); otherwise everything is read into memory.  verify recomputes the checksum, which reads the whole file.
+		</summary>
+		<returns>the Scenario, with its generation parameters in params()</returns> '''
+	@classmethod
+	def load( cls, path, mmap=True, verify=True ):
+		with open( path, 'rb' ) as f:
+			if f.read( len(cls.FILE_MAGIC) ) != cls.FILE_MAGIC:
+				raise ValueError( '{} is not a scenario file'.format(path) )
+			headerLength = int( np.frombuffer(f.read(8), dtype='<u8')[0] )
+			header = json.loads( f.read(headerLength).decode('utf-8') )
+		if header.get( 'format' ) not in (1, cls.FILE_FORMAT):
+			raise ValueError( '{} has unknown scenario file format {}'.format(path, header.get('format')) )
+		start = -(-(len(cls.FILE_MAGIC) + 8 + headerLength) // cls.FILE_ALIGN) * cls.FILE_ALIGN
+
+		arrays = {}
+		for name, info in header['arrays'].items():
+			shape = tuple( info['shape'] )
+			if mmap:
+				arrays[name] = np.memmap( path, dtype=info['dtype'], mode='r',
+										  offset=start + info['offset'], shape=shape )
+			else:
+				arrays[name] = np.fromfile( path, dtype=info['dtype'], count=int(np.prod(shape)),
+											offset=start + info['offset'] ).reshape( shape )
+		if verify:
+			checksum = cls._hashHeader( header ) if header['format'] >= 2 else hashlib.sha256()
+			for name in header['arrays']:
+				cls._hashArray( checksum, arrays[name] )
+			if checksum.hexdigest() != header['sha256']:
+				raise ValueError( '{} is corrupt (checksum mismatch)'.format(path) )
+
+		ncities = len( arrays['x'] )
+		if header['format'] == 1:
+			edge_exists = np.unpackbits( arrays['edge_exists'], count=ncities*ncities ).reshape( ncities, ncities ).astype( bool )
+		else:
+			edge_exists = arrays['edge_exists'].view( np.ndarray )
+		matrix = arrays['cost_matrix'].view( np.ndarray )	# a plain array, still backed by the map
+		return cls.fromArrays( header['params'], arrays['x'], arrays['y'], arrays['elevation'], edge_exists, matrix )
+
+	''' <summary>
+		Rebuilds a dense-edge scenario from its parts (as load() and TSPBatch do) without
+		generating or thinning anything.  cost_matrix is used as is, made read-only, and
+		edge_exists defaults to its finite entries.
+		</summary> '''
+	@classmethod
+	def fromArrays( cls, params, xs, ys, elevations, edge_exists, cost_matrix ):
+		scenario = cls.__new__( cls )
+		scenario._coordinates = None
+		scenario._edgeSeed, scenario._keepNext, scenario._removeFraction = 0, None, 0.0
+		scenario._difficulty = params['difficulty']
+		scenario._rand_seed = params['seed']
+		scenario._thin_version = params['thin_version']
+		scenario._cities = [City( x, y, elevation ) for x, y, elevation in
+							zip( np.asarray(xs).tolist(), np.asarray(ys).tolist(), np.asarray(elevations).tolist() )]
+		for num, city in enumerate( scenario._cities ):
+			city.setScenario( scenario )
+			city.setIndexAndName( num, nameForInt( num+1 ) )
+		cost_matrix.flags.writeable = False
+		scenario._edge_exists = edge_exists if edge_exists is not None else np.isfinite( cost_matrix )
+		scenario._cost_matrix = cost_matrix
+		return scenario
+
+	# A SHA-256 digest started on everything in header but the checksum itself.
+	@classmethod
+	def _hashHeader( cls, header ):
+		fields = {key: value for key, value in header.items() if key != 'sha256'}
+		return hashlib.sha256( json.dumps( fields, sort_keys=True ).encode( 'utf-8' ) )
+
+	@classmethod
+	def _hashArray( cls, checksum, array ):
+		flat = np.ascontiguousarray( array ).reshape( -1 ).view( np.uint8 )
+		for chunk in range( 0, len(flat), cls._FILE_CHUNK ):
+			checksum.update( flat[chunk:chunk + cls._FILE_CHUNK] )
+
 
 	def randperm( self, n ):				#isn't there a numpy function that does this and even gets called in Solver?
 		perm = np.arange(n)
@@ -103,7 +417,47 @@ class Scenario:
 			perm[randind] = save
 		return perm
 
-	def thinEdges( self, deterministic=False ):
+	''' <summary>
+		Removes HARD_MODE_FRACTION_TO_REMOVE of the edges, always keeping one random
+		Hamiltonian cycle so a tour exists.  Version 2 picks the edges to remove in one
+		draw without replacement from the deletable ones; in deterministic mode it draws
+		from its own generator seeded with the scenario's rand_seed.  Version 1 is the
+		original one-edge-at-a-time rejection loop, kept so old seeds can reproduce the
+		graphs they used to give.  Version 3 (LAZY_EDGE_VERSION) stores no mask at all:
+		each edge off the kept cycle is removed with probability
+		HARD_MODE_FRACTION_TO_REMOVE by a hash of the edge (see edgeExists), so the
+		fraction removed is only close to, not exactly, that.
+		</summary> '''
+	def thinEdges( self, deterministic=False, version=THIN_VERSION ):
+		if version == 1:
+			self._thinEdgesLegacy(deterministic)
+			return
+		if version not in (2, self.LAZY_EDGE_VERSION):
+			raise ValueError('unknown edge thinning version {}'.format(version))
+
+		ncities = len(self._cities)
+		rng = np.random.default_rng(self._rand_seed) if deterministic else np.random
+
+		# Set aside a route to ensure at least one tour exists
+		route_keep = rng.permutation( ncities )
+		if version == self.LAZY_EDGE_VERSION:
+			self._edge_exists = None
+			self._keepNext = np.empty( ncities, dtype=np.intp )
+			self._keepNext[route_keep] = np.roll( route_keep, -1 )
+			self._edgeSeed = int( rng.integers(2**63) if deterministic else rng.randint(2**63, dtype=np.int64) )
+			self._removeFraction = self.HARD_MODE_FRACTION_TO_REMOVE
+			return
+
+		edge_count = ncities*(ncities-1) # can't have self-edge
+		num_to_remove = int(np.floor(self.HARD_MODE_FRACTION_TO_REMOVE*edge_count))
+		can_delete = self._edge_exists.copy()
+		can_delete[route_keep, np.roll(route_keep, -1)] = False
+
+		deletable = np.flatnonzero( can_delete )
+		removed = rng.choice( deletable, size=num_to_remove, replace=False )
+		self._edge_exists.flat[removed] = False
+
+	def _thinEdgesLegacy( self, deterministic=False ):
 		ncities = len(self._cities)
 		edge_count = ncities*(ncities-1) # can't have self-edge
 		num_to_remove = np.floor(self.HARD_MODE_FRACTION_TO_REMOVE*edge_count)
@@ -159,21 +513,11 @@ class City:
 
 		assert( type(other_city) == City )
 
-		# In hard mode, remove edges; this slows down the calculation...
-		# Use this in all difficulties, it ensures INF for self-edge
-		if not self._scenario._edge_exists[self._index, other_city._index]:
+		# The scenario precomputes every edge (see Scenario.getCostMatrix), or works it out
+		# without the matrix for lazy-edge scenarios; removed edges and self-edges are INF.
+		cost = self._scenario.edgeCosts( self._index, other_city._index )
+		if cost == np.inf:
 			return np.inf
 
-		# Euclidean Distance
-		cost = math.sqrt( (other_city._x - self._x)**2 +
-						  (other_city._y - self._y)**2 )
-
-		# For Medium and Hard modes, add in an asymmetric cost (in easy mode it is zero).
-		if not self._scenario._difficulty == 'Easy':
-			cost += (other_city._elevation - self._elevation)
-			if cost < 0.0:
-				cost = 0.0					# Shouldn't it cost something to go downhill, no matter how steep??????
-
-
-		return int(math.ceil(cost * self.MAP_SCALE))
+		return int(cost)
 
@@ -0,0 +1,205 @@
+#!/usr/bin/python3
+
+import itertools
+import math
+import time
+import numpy as np
+
+from TSPClasses import City
+
+
+
+''' <summary>
+	Sparse candidate structure for big scenarios: the k cheapest outgoing and incoming
+	edges of every city, found without building the n x n cost matrix.  Cities are
+	bucketed into a uniform grid of about CELL_OCCUPANCY cities per cell.  The cities of
+	each BLOCK x BLOCK square of cells are scored against those in a wider square around
+	it, grown until nothing outside it can be cheaper: a city r cells away is at least
+	r * cellSize away, and the elevation term can take off at most the gap between this
+	city's elevation and the lowest (for outgoing edges; highest for incoming) elevation
+	anywhere.  Missing edges cost INF and so are only picked when there is nothing else.
+	neighbors[i] / costs[i] hold the outgoing candidates of city i cheapest first, and
+	incoming[i] / incomingCosts[i] the incoming ones.  If deadline (a time.time() value)
+	passes first, the cities not reached yet are left with no candidates (-1, costing inf)
+	and complete is False; the grid, and so cheapestFrom, works either way.
+	</summary>
+'''
+class CandidateIndex:
+	CELL_OCCUPANCY = 4	# average number of cities per grid cell
+	_SLACK = 1e-9		# keeps the distance bounds safely below the true distances
+
+	def __init__( self, scenario, k=10, deadline=None ):
+		self._scenario = scenario
+		xs, ys, elevations = scenario.coordinates()
+		self.ncities = len(xs)
+		self.k = max(0, min(k, self.ncities - 1))
+		self._xs, self._ys = xs, ys
+		self._elevations = elevations if scenario._difficulty != 'Easy' else np.zeros(self.ncities)
+		self._deadline = deadline
+		self.complete = True
+		self._buildGrid()
+		self.neighbors, self.costs = self._nearest(True)
+		self.incoming, self.incomingCosts = self._nearest(False)
+
+	def _buildGrid( self ):
+		n = max(self.ncities, 1)
+		self._x0 = self._xs.min() if self.ncities else 0.0
+		self._y0 = self._ys.min() if self.ncities else 0.0
+		width = (self._xs.max() - self._x0) if self.ncities else 0.0
+		height = (self._ys.max() - self._y0) if self.ncities else 0.0
+		self.cellSize = max(math.sqrt(width * height * self.CELL_OCCUPANCY / n),
+							max(width, height) * self.CELL_OCCUPANCY / n, 1e-12)
+		self.nx = int(width // self.cellSize) + 1
+		self.ny = int(height // self.cellSize) + 1
+		gx = np.minimum(((self._xs - self._x0) / self.cellSize).astype(np.intp), self.nx - 1)
+		gy = np.minimum(((self._ys - self._y0) / self.cellSize).astype(np.intp), self.ny - 1)
+		self.cellOf = gy * self.nx + gx
+		self.ncells = self.nx * self.ny
+		self._byCell = np.argsort(self.cellOf, kind = 'stable')
+		self._cellStart = np.searchsorted(self.cellOf[self._byCell], np.arange(self.ncells + 1))
+
+	# All cities in the cells within r cells (in x and y) of the cells x0..x1, y0..y1.
+	def _citiesAround( self, x0, x1, y0, y1, r ):
+		x0, x1 = max(x0 - r, 0), min(x1 + r, self.nx - 1)
+		rows = np.arange(max(y0 - r, 0), min(y1 + r, self.ny - 1) + 1) * self.nx
+		starts, ends = self._cellStart[rows + x0], self._cellStart[rows + x1 + 1]
+		return np.concatenate([self._byCell[s:e] for s, e in zip(starts, ends)])
+
+	# Cities are handled a BLOCK x BLOCK square of cells at a time, which keeps the
+	# numpy calls few and big.
+	BLOCK = 4
+
+	def _nearest( self, outgoing ):
+		k, scale = self.k, City.MAP_SCALE
+		neighbors = np.full((self.ncities, k), -1, dtype = np.intp)
+		costs = np.full((self.ncities, k), np.inf)
+		if k == 0:
+			return neighbors, costs
+		elevations = self._elevations
+		extreme = elevations.min() if outgoing else elevations.max()
+		for x0, y0 in itertools.product(range(0, self.nx, self.BLOCK), range(0, self.ny, self.BLOCK)):
+			if self._deadline is not None and (not self.complete or time.time() >= self._deadline):
+				self.complete = False
+				break
+			x1, y1 = min(x0 + self.BLOCK, self.nx) - 1, min(y0 + self.BLOCK, self.ny) - 1
+			rows = self._citiesAround(x0, x1, y0, y1, 0)
+			r = 1
+			while len(rows):
+				pool = self._citiesAround(x0, x1, y0, y1, r)
+				if outgoing:
+					block = self._scenario.pairCosts(rows[:, np.newaxis], pool[np.newaxis, :])
+				else:
+					block = self._scenario.pairCosts(pool[np.newaxis, :], rows[:, np.newaxis])
+				if len(pool) > k:
+					chosen = np.argpartition(block, k - 1, axis = 1)[:, :k]
+				else:
+					chosen = np.argsort(block, axis = 1)
+				chosenCosts = np.take_along_axis(block, chosen, axis = 1)
+				kth = chosenCosts.max(axis = 1) if len(pool) > k else np.full(len(rows), np.inf)
+
+				# Lower bound on the cost of any edge to (or from) a city outside the square.
+				everything = x0 - r <= 0 and y0 - r <= 0 and x1 + r >= self.nx - 1 and y1 + r >= self.ny - 1
+				if everything:
+					proven = np.ones(len(rows), dtype = bool)
+				else:
+					reach = r * self.cellSize - self._SLACK
+					rise = extreme - elevations[rows] if outgoing else elevations[rows] - extreme
+					proven = np.ceil(scale * np.maximum(reach + rise, 0.0)) >= kth
+
+				done = rows[proven]
+				if len(done):
+					order = np.argsort(chosenCosts[proven], axis = 1, kind = 'stable')
+					neighbors[done] = pool[np.take_along_axis(chosen[proven], order, axis = 1)]
+					costs[done] = np.take_along_axis(chosenCosts[proven], order, axis = 1)
+				if everything:
+					break
+
+				# Widen the square, at most doubling it: a wider pool usually lowers kth too
+				# (often to 0, which proves everything), so the radius the current kth calls
+				# for is an overestimate.
+				rows, kth, rise = rows[~proven], kth[~proven], rise[~proven]
+				if len(rows) == 0:
+					break
+				if np.isinf(kth).any():
+					r *= 2
+				else:
+					needed = int(np.ceil(np.max((kth / scale - rise) / self.cellSize))) + 1
+					r = max(r + 1, min(needed, 2 * r))
+		return neighbors, costs
+
+	''' <summary>
+		A cheap edge from city to a city not yet visited, for when all of city's candidates
+		are used up.  The square of cells around city is doubled until it holds a reachable
+		unvisited city, then doubled once more, and the cheapest edge into that square wins.
+		That is the cheapest edge overall unless the elevation term makes a city further
+		out cheaper, and the search stops early when the same bound as in _nearest proves
+		nothing outside the square can be.
+		</summary>
+		<returns>the city, or -1 if no unvisited city can be reached from city</returns>
+	'''
+	def cheapestFrom( self, city, visited ):
+		cx, cy = self.cellOf[city] % self.nx, self.cellOf[city] // self.nx
+		rise = self._elevations.min() - self._elevations[city]
+		best, bestCost, last = -1, np.inf, None
+		r = 1
+		while True:
+			pool = self._citiesAround(cx, cx, cy, cy, r)
+			pool = pool[~visited[pool]]
+			if len(pool):
+				costs = self._scenario.pairCosts(city, pool)
+				cheapest = int(np.argmin(costs))
+				if costs[cheapest] < bestCost:
+					best, bestCost = int(pool[cheapest]), costs[cheapest]
+			everything = cx - r <= 0 and cy - r <= 0 and cx + r >= self.nx - 1 and cy + r >= self.ny - 1
+			reach = r * self.cellSize - self._SLACK + rise
+			if everything or r == last or math.ceil(City.MAP_SCALE * max(reach, 0.0)) >= bestCost:
+				return best
+			if last is None and bestCost < np.inf:
+				last = 2 * r
+			r *= 2
+
+
+
+# dist[a][b] for LocalSearch on big scenarios: the cost of edge a -> b worked out on
+# demand in plain Python (the same arithmetic as Scenario.pairCosts), with missing edges
+# costing infinite instead of INF.  Local search asks for the same edges over and over,
+# so costs are remembered, up to MEMO_LIMIT of them before starting afresh.
+class PairCosts:
+	MEMO_LIMIT = 2**21
+
+	def __init__( self, scenario, infinite=math.inf ):
+		self._scenario = scenario
+		self._xs, self._ys, self._elevations = (array.tolist() for array in scenario.coordinates())
+		self._useElevation = scenario._difficulty != 'Easy'
+		self._infinite = infinite
+		self._ncities = len(self._xs)
+		self._memo = {}
+
+	def cost( self, a, b ):
+		key = a * self._ncities + b
+		cost = self._memo.get(key)
+		if cost is not None:
+			return cost
+		if not self._scenario.edgeExistsPair(a, b):
+			cost = self._infinite
+		else:
+			cost = math.sqrt((self._xs[b] - self._xs[a])**2 + (self._ys[b] - self._ys[a])**2)
+			if self._useElevation:
+				cost = max(cost + (self._elevations[b] - self._elevations[a]), 0.0)
+			cost = float(math.ceil(cost * City.MAP_SCALE))
+		if len(self._memo) >= self.MEMO_LIMIT:
+			self._memo.clear()
+		self._memo[key] = cost
+		return cost
+
+	def __getitem__( self, a ):
+		return _PairCostRow(self, a)
+
+class _PairCostRow:
+	__slots__ = ('_costs', '_a')
+
+	def __init__( self, costs, a ):
+		self._costs, self._a = costs, a
+
+	def __getitem__( self, b ):
+		return self._costs.cost(self._a, b)
@@ -0,0 +1,98 @@
+#!/usr/bin/python3
+
+import json
+import time
+
+
+
+''' <summary>
+	Opt-in instrumentation for the solvers (see TSPSolver.setProfiling).  A Profiler
+	collects the calls and seconds spent in each named phase of a solve, plus a time
+	series of whatever values the solver samples (queue size, BSSF, lowest bound...).
+	Solvers only touch it behind an "if profile:" test, so with profiling off the cost
+	is one truth test per phase.
+	</summary>
+'''
+class Profiler:
+	SAMPLE_INTERVAL = 0.05	# seconds between time-series samples
+
+	def __init__( self, name=None ):
+		self.name = name
+		self.phases = {}	# phase -> [calls, seconds]
+		self.series = []	# (seconds since start, {value name: value})
+		self.running = True
+		self.elapsed = None
+		self._start = time.perf_counter()
+		self._lastSample = -self.SAMPLE_INTERVAL
+
+	# For timing a phase: t = profile.clock(); ...; profile.add('phase', t)
+	@staticmethod
+	def clock():
+		return time.perf_counter()
+
+	# Charge the time since start (a clock() reading) to phase, and return the clock so
+	# consecutive phases can be chained.
+	def add( self, phase, start, calls=1 ):
+		now = time.perf_counter()
+		entry = self.phases.get(phase)
+		if entry is None:
+			self.phases[phase] = [calls, now - start]
+		else:
+			entry[0] += calls
+			entry[1] += now - start
+		return now
+
+	# True if it is time for another sample; lets callers skip computing costly values.
+	def due( self ):
+		return time.perf_counter() - self._start - self._lastSample >= self.SAMPLE_INTERVAL
+
+	# Record values at the current time (at most once per SAMPLE_INTERVAL unless forced).
+	def sample( self, force=False, **values ):
+		now = time.perf_counter() - self._start
+		if not force and now - self._lastSample < self.SAMPLE_INTERVAL:
+			return
+		self._lastSample = now
+		self.series.append((now, values))
+
+	def finish( self ):
+		self.elapsed = time.perf_counter() - self._start
+		self.running = False
+
+	def toDict( self ):
+		return {
+			'name': self.name,
+			'elapsed': self.elapsed,
+			'phases': {phase: {'calls': calls, 'seconds': seconds}
+					   for phase, (calls, seconds) in self.phases.items()},
+			'series': [dict(values, time=t) for t, values in self.series],
+		}
+
+	# Table of phases, most expensive first.
+	def summary( self ):
+		elapsed = self.elapsed if self.elapsed is not None else time.perf_counter() - self._start
+		lines = ['{} profile: {:.4f} s total'.format(self.name or 'solver', elapsed),
+				 '{:<24} {:>10} {:>10} {:>7} {:>12}'.format('phase', 'calls', 'seconds', '%', 'us/call')]
+		for phase, (calls, seconds) in sorted(self.phases.items(), key=lambda item: -item[1][1]):
+			lines.append('{:<24} {:>10} {:>10.4f} {:>6.1f}% {:>12.2f}'.format(
+				phase, calls, seconds, 100.0 * seconds / elapsed if elapsed else 0.0,
+				1e6 * seconds / calls if calls else 0.0))
+		lines.append('{} samples'.format(len(self.series)))
+		return '\n'.join(lines)
+
+	# Writes the profile as JSON, or as CSV if path ends in .csv (the phase table, a
+	# blank line, then the time series with one column per sampled value).
+	def save( self, path ):
+		with open(path, 'w') as f:
+			if not path.lower().endswith('.csv'):
+				json.dump(self.toDict(), f, indent=1)
+				return
+			f.write('phase,calls,seconds\n')
+			for phase, (calls, seconds) in self.phases.items():
+				f.write('{},{},{}\n'.format(phase, calls, seconds))
+			columns = []
+			for _, values in self.series:
+				columns += [name for name in values if name not in columns]
+			f.write('\ntime,{}\n'.format(','.join(columns)))
+			for t, values in self.series:
+				f.write('{},{}\n'.format(t, ','.join('' if values.get(name) is None else str(values[name])
+													 for name in columns)))
@@ -1,34 +1,1043 @@
 #!/usr/bin/python3
 
-from which_pyqt import PYQT_VER
-if PYQT_VER == 'PYQT5':
-	from PyQt5.QtCore import QLineF, QPointF
-elif PYQT_VER == 'PYQT4':
-	from PyQt4.QtCore import QLineF, QPointF
-elif PYQT_VER == 'PYQT6':
-	from PyQt6.QtCore import QLineF, QPointF
-else:
-	raise Exception('Unsupported Version of PyQt: {}'.format(PYQT_VER))
-
-
-
-
+# Note: no Qt in here (or in TSPClasses), so the solvers can be run headless; see Proj5CLI.py.
 import time
 import numpy as np
 from TSPClasses import *
+from TSPNeighbors import CandidateIndex, PairCosts
+from TSPProfiler import Profiler
+import collections
 import heapq
 import itertools
-import uuid
+import queue
+import random
+import threading
+
+
+
+# Solvers offered by the GUI and the command line: (label, TSPSolver method name).
+ALGORITHMS = [ \
+	('Default                            ','defaultRandomTour'), \
+	('Greedy','greedy'), \
+	('Branch and Bound','branchAndBound'), \
+	('Parallel Branch and Bound','parallelBranchAndBound'), \
+	('Held-Karp','heldKarp'), \
+	('Cheapest Insertion','cheapestInsertion'), \
+	('Farthest Insertion','farthestInsertion'), \
+	('Genetic','genetic'), \
+	('Simulated Annealing','annealing'), \
+	('Ant Colony','antColony'), \
+	('Fancy','fancy') \
+]															# whitespace hack to get longest to display correctly in the GUI
+
+
+# One branch-and-bound search state.  States are kept small because the frontier can
+# hold hundreds of thousands of them: the path is a chain of parent pointers rather than
+# a list per state, and the reduced-cost matrix is stored in single precision (costs are
+# integers well inside float32's exact range) and dropped as soon as the state is expanded.
+class BBState:
+	__slots__ = ('bound', 'city', 'depth', 'parent', 'matrix', 'assignment')
+
+	DTYPE = np.float32
+
+	def __init__( self, bound, city, depth, parent, matrix, assignment=None ):
+		self.bound = bound
+		self.city = city
+		self.depth = depth
+		self.parent = parent
+		self.matrix = matrix
+		self.assignment = assignment # Only used by AssignmentBound.
+
+	# Drop everything but what the children's paths need.
+	def release( self ):
+		self.matrix = None
+		self.assignment = None
+
+	# City indices of the partial tour, from the start city to this state's city.
+	def path( self ):
+		path = np.empty(self.depth, dtype=np.intp)
+		state = self
+		for i in range(self.depth - 1, -1, -1):
+			path[i] = state.city
+			state = state.parent
+		return path
+
+	# Bytes per queued state besides its arrays: the state, its bound, its heap entry and
+	# its share of the expanded ancestors that its path keeps alive.
+	OVERHEAD = 512
+
+	# Memory a queued state keeps alive: its arrays (each its own allocation, see
+	# expandState) plus OVERHEAD.
+	def retained( self ):
+		size = self.OVERHEAD
+		if self.matrix is not None:
+			size += self.matrix.nbytes
+		if self.assignment is not None:
+			size += self.assignment.nbytes
+		return size
+
+	# The same for a state on an ncities problem that has not been built yet.
+	@staticmethod
+	def nbytes( ncities, assignment=False ):
+		size = BBState.OVERHEAD + ncities * ncities * np.dtype(BBState.DTYPE).itemsize
+		if assignment:
+			size += ncities * np.dtype(np.int32).itemsize
+		return size
+
+
+
+# Row-and-column reduce a matrix, or a stack of matrices along the leading axis, in place.
+# Rows and columns that are entirely INF (cities already left or entered) are left alone.
+# Returns the amount subtracted, which is how much the lower bound rises.
+def reduceMatrix( matrix ):
+	rowMins = np.amin(matrix, axis = -1, keepdims = True)
+	rowMins[rowMins == np.inf] = 0
+	matrix -= rowMins
+	colMins = np.amin(matrix, axis = -2, keepdims = True)
+	colMins[colMins == np.inf] = 0
+	matrix -= colMins
+	return np.sum(rowMins, axis = (-2, -1)) + np.sum(colMins, axis = (-2, -1))
+
+# Same result as reduceMatrix for a child of a fully reduced parent, touching only the rows
+# and columns that can have lost their zero: rows whose zero was in the newly blocked
+# column or return edge, and columns whose zero was in the newly blocked row.
+def reduceChildMatrix( matrix, parent, fromCity, toCity ):
+	rows = np.append(np.flatnonzero(parent[:, toCity] == 0), toCity)
+	rowMins = np.amin(matrix[rows, :], axis = 1)
+	rowMins[rowMins == np.inf] = 0
+	matrix[rows, :] -= rowMins[:, np.newaxis]
+	cols = np.union1d(np.flatnonzero(parent[fromCity, :] == 0), [0])
+	colMins = np.amin(matrix[:, cols], axis = 0)
+	colMins[colMins == np.inf] = 0
+	matrix[:, cols] -= colMins[np.newaxis, :]
+	return np.sum(rowMins) + np.sum(colMins)
+
+# Generate the children of a branch-and-bound state whose bound beats cutoff.
+# Moving from city i to city j blocks row i, column j and (unless j is the last city)
+# the early return j -> 0, then reduces both rows and columns.  By default all children
+# are built and reduced together as one (children x n x n) array; incremental=True builds
+# them one at a time and only re-reduces the rows and columns the move touched.
+# Returns (number of children considered, [(bound, city, matrix)]), every matrix its own
+# array; the move that closes a tour comes back with a None matrix.  Copying and reduction are timed into profile if given.
+def expandState( state, ncities, cutoff, incremental = False, profile = None ):
+	parent, current = state.matrix, state.city
+	if state.depth == ncities:
+		# Every city has been visited, so the only way on is back to the start.
+		bound = state.bound + parent[current, 0]
+		return ncities - 1, [(bound, 0, None)] if bound < cutoff else []
+
+	cities = np.arange(1, ncities)
+	cities = cities[cities != current]
+	considered = len(cities)
+	bounds = state.bound + parent[current, cities].astype(float)
+	keep = bounds < cutoff # Can't beat the cutoff, so don't bother reducing.
+	cities, bounds = cities[keep], bounds[keep]
+	blockReturn = state.depth + 1 < ncities
+
+	if profile: t = profile.clock()
+	if incremental:
+		matrices = []
+		for k, city in enumerate(cities):
+			child = parent.copy()
+			child[current, :] = np.inf
+			child[:, city] = np.inf
+			if blockReturn:
+				child[city, 0] = np.inf
+			if profile: t = profile.add('child copy', t)
+			bounds[k] += reduceChildMatrix(child, parent, current, city)
+			if profile: t = profile.add('reduction', t)
+			matrices.append(child)
+	else:
+		matrices = np.repeat(parent[np.newaxis], len(cities), axis = 0)
+		children = np.arange(len(cities))
+		matrices[:, current, :] = np.inf
+		matrices[children, :, cities] = np.inf
+		if blockReturn:
+			matrices[children, cities, 0] = np.inf
+		if profile: t = profile.add('child copy', t, len(cities))
+		bounds += reduceMatrix(matrices)
+		if profile: t = profile.add('reduction', t, len(cities))
+		# Each kept child gets its own copy: a view would keep the whole stack alive for as
+		# long as any one sibling is queued.
+		matrices = [matrices[k].copy() if bound < cutoff else None for k, bound in enumerate(bounds)]
+		if profile: profile.add('child copy', t)
+
+	return considered, [(bound, int(city), matrix) for bound, city, matrix
+						in zip(bounds, cities, matrices) if bound < cutoff]
+
+# One step of the shortest-augmenting-path assignment algorithm, run directly on a
+# reduced matrix (all live entries >= 0, assigned pairs at 0).  Finds the cheapest way to
+# give row a column, flips the assignment along it, and folds the new dual values back into
+# the matrix so it stays reduced.  Returns how much the assignment lower bound rose
+# (INF if the row cannot be assigned at all).
+def augmentAssignment( matrix, assignment, owner, row ):
+	dist = matrix[row].astype(float)
+	via = np.full(len(matrix), row)
+	done = np.zeros(len(matrix), dtype = bool)
+	reachedRows, reachedDist = [row], [0.0]
+	while True:
+		unscanned = np.where(done, np.inf, dist)
+		col = int(np.argmin(unscanned))
+		delta = unscanned[col]
+		if delta == np.inf:
+			return np.inf
+		done[col] = True
+		nextRow = owner[col]
+		if nextRow < 0:
+			break
+		reachedRows.append(nextRow)
+		reachedDist.append(delta)
+		relaxed = delta + matrix[nextRow]
+		better = relaxed < dist
+		dist[better] = relaxed[better]
+		via[better] = nextRow
+
+	doneCols = np.flatnonzero(done)
+	matrix[:, doneCols] += delta - dist[doneCols]
+	matrix[reachedRows, :] -= (delta - np.array(reachedDist))[:, np.newaxis]
+	while True:
+		nextRow = via[col]
+		previous = assignment[nextRow]
+		assignment[nextRow] = col
+		owner[col] = nextRow
+		if nextRow == row:
+			return delta
+		col = previous
+
+def _assignmentOwners( assignment ):
+	owner = np.full(len(assignment), -1, dtype = assignment.dtype)
+	rows = np.flatnonzero(assignment >= 0)
+	owner[assignment[rows]] = rows
+	return owner
+
+
+
+# Lower bounds for branch and bound (TSPSolver.BOUNDS maps names to them).  root() turns
+# the reduced root matrix into the root state, and expand() generates the children of a
+# state whose bound is below cutoff, returning (number of children considered, [BBState]).
+# A child that closes the tour has a None matrix.  While profile is set to a Profiler,
+# the work is timed into it.
+
+# Row-and-column reduction: the classic reduced-cost bound (see expandState).
+class ReductionBound:
+	profile = None
+
+	def __init__( self, incremental=False ):
+		self.incremental = incremental
+
+	def root( self, matrix, lowerBound ):
+		return BBState(lowerBound, 0, 1, None, matrix.astype(BBState.DTYPE))
+
+	def expand( self, state, ncities, cutoff ):
+		considered, children = expandState(state, ncities, cutoff, self.incremental, self.profile)
+		return considered, [BBState(bound, city, state.depth + 1, state, matrix)
+							for bound, city, matrix in children]
+
+# Assignment-problem relaxation: the cheapest way to give every remaining city one
+# successor, ignoring subtours.  It is at least as tight as row-and-column reduction, which
+# is just one feasible set of assignment duals.  Each state keeps its optimal assignment and
+# a matrix already reduced by the optimal duals, so a child starts from its parent's
+# solution: fixing one edge breaks at most two assigned pairs (plus the blocked return to
+# the start), and each costs one O(n^2) augmentation instead of an O(n^3) solve.
+class AssignmentBound( ReductionBound ):
+	def root( self, matrix, lowerBound ):
+		state = ReductionBound.root(self, matrix, lowerBound)
+		assignment = np.full(len(matrix), -1, dtype = np.int32)
+		owner = np.full(len(matrix), -1, dtype = np.int32)
+		for row in range(len(matrix)): # Take whatever zeros the reduction left first.
+			for col in np.flatnonzero(state.matrix[row] == 0):
+				if owner[col] < 0:
+					assignment[row], owner[col] = col, row
+					break
+		free = np.flatnonzero(assignment < 0)
+		state.bound += self._assign(state.matrix, assignment, owner, free, np.inf)
+		state.assignment = assignment
+		return state
+
+	def expand( self, state, ncities, cutoff ):
+		current = state.city
+		considered, children = ReductionBound.expand(self, state, ncities, cutoff)
+		kept = []
+		for child in children:
+			if child.matrix is not None:
+				city = child.city
+				assignment = state.assignment.copy()
+				free = []
+				previousOwner = np.flatnonzero(assignment == city)
+				if len(previousOwner) and previousOwner[0] != current:
+					assignment[previousOwner[0]] = -1
+					free.append(previousOwner[0])
+				assignment[current] = -1
+				if child.depth < ncities and assignment[city] == 0: # The early return was blocked.
+					assignment[city] = -1
+					free.append(city)
+				child.bound += self._assign(child.matrix, assignment, _assignmentOwners(assignment),
+											free, cutoff - child.bound)
+				child.assignment = assignment
+			if child.bound < cutoff:
+				kept.append(child)
+		return considered, kept
+
+	# Augment each free row, stopping early once the bound has risen by limit.
+	def _assign( self, matrix, assignment, owner, rows, limit ):
+		if self.profile: t = self.profile.clock()
+		rise = 0.0
+		for row in rows:
+			rise += augmentAssignment(matrix, assignment, owner, row)
+			if rise >= limit:
+				break
+		if self.profile: self.profile.add('assignment', t)
+		return rise
+
+
+
+# Parallel branch and bound (see TSPSolver.parallelBranchAndBound).  Work moves between
+# processes as (bound, path, matrix, assignment) items on a shared queue; the shared counters are
+#   bssfCost    - the best tour cost found by anyone, which every worker prunes against
+#   outstanding - items handed out that have not been searched to exhaustion yet
+#   idle        - workers with nothing to do
+#   queued      - items sitting in the work queue
+def _shareState( workQueue, state, outstanding, queued ):
+	with outstanding.get_lock():
+		outstanding.value += 1
+	with queued.get_lock():
+		queued.value += 1
+	workQueue.put((state.bound, state.path(), state.matrix, state.assignment))
+	state.release()
+
+def _unshareState( item ):
+	bound, path, matrix, assignment = item
+	state = None
+	for depth, city in enumerate(path, 1):
+		state = BBState(bound, int(city), depth, state, None)
+	state.matrix, state.assignment = matrix, assignment
+	return state
+
+def _bbWorker( workQueue, resultQueue, bssfCost, outstanding, idle, queued,
+			   ncities, deadline, bounder, maxFrontier ):
+	total = 0
+	pruned = 0
+	maxHeapSize = 0
+	optimal = True
+	heap = []
+	tieBreaker = itertools.count()
+	working = False
+	waiting = False
+
+	while time.time() < deadline.value:
+		if not heap:
+			# Out of work: finish off the current item and wait for somebody to share.
+			if working:
+				with outstanding.get_lock():
+					outstanding.value -= 1
+				working = False
+			if not waiting:
+				with idle.get_lock():
+					idle.value += 1
+				waiting = True
+			if outstanding.value == 0:
+				break
+			try:
+				item = workQueue.get(timeout=0.05)
+			except queue.Empty:
+				continue
+			with queued.get_lock():
+				queued.value -= 1
+			with idle.get_lock():
+				idle.value -= 1
+			working, waiting = True, False
+			state = _unshareState(item)
+			heapq.heappush(heap, (state.bound, next(tieBreaker), state))
+			continue
+
+		_, _, current = heapq.heappop(heap)
+		cutoff = bssfCost.value
+		if current.bound > cutoff:
+			pruned += 1
+			continue
+
+		considered, children = bounder.expand(current, ncities, cutoff)
+		current.release()
+		total += considered
+		pruned += considered - len(children)
+		for child in children:
+			if child.matrix is None: # A full path was made; publish it if it is still the best.
+				with bssfCost.get_lock():
+					improved = child.bound < bssfCost.value
+					if improved:
+						bssfCost.value = child.bound
+				if improved:
+					resultQueue.put(('tour', child.bound, current.path().tolist()))
+			else:
+				heapq.heappush(heap, (child.bound, next(tieBreaker), child))
+		if maxHeapSize < len(heap):
+			maxHeapSize = len(heap)
+
+		if len(heap) > maxFrontier: # Over the memory cap: keep the better-bound half.
+			optimal = False
+			kept = heapq.nsmallest(maxFrontier // 2, heap)
+			pruned += len(heap) - len(kept)
+			heap = kept
+			heapq.heapify(heap)
+
+		# Hand the most promising states to idle workers.
+		while len(heap) > 1 and idle.value > queued.value:
+			_, _, state = heapq.heappop(heap)
+			_shareState(workQueue, state, outstanding, queued)
+
+	for _, _, state in heap:
+		if state.bound > bssfCost.value:
+			pruned += 1
+		elif state.bound < bssfCost.value:
+			optimal = False
+	resultQueue.put(('stats', total, pruned, maxHeapSize, optimal))
+
+
+
+# Stands in for INF while local search compares moves, so a tour that still uses a missing
+# edge can be improved toward one that doesn't (INF - INF would be NaN).
+INFEASIBLE_EDGE_COST = 1.0e9
+
+# dist[a][b] for LocalSearch from dist, a cost matrix already free of inf.  Python lists
+# index fastest, but copying a big matrix into them takes seconds and gigabytes, so over
+# ROW_LIST_LIMIT cities each row is a memoryview into dist instead, which still indexes
+# to plain floats without copying anything.
+ROW_LIST_LIMIT = 500
+
+def costRows( dist ):
+	if len(dist) <= ROW_LIST_LIMIT:
+		return dist.tolist()
+	return [memoryview(row) for row in np.ascontiguousarray(dist)]
+
+# The k cheapest outgoing and incoming neighbours of every city, cheapest first.
+def candidateLists( matrix, k ):
+	k = min(k, len(matrix) - 1)
+	lists = []
+	for costs in (matrix, matrix.T):
+		nearest = np.argpartition(costs, k - 1, axis = 1)[:, :k]
+		order = np.argsort(np.take_along_axis(costs, nearest, axis = 1), axis = 1, kind = 'stable')
+		lists.append(np.take_along_axis(nearest, order, axis = 1).tolist())
+	return lists
+
+# Insertion construction for asymmetric costs: start from the cheapest two-city cycle and
+# insert the remaining cities one at a time where they add the least, taking next either
+# the city that is cheapest to insert or (farthest=True) the one furthest from the tour.
+# Each unrouted city remembers its INSERTION_SLOTS cheapest insertion edges (u -> v, by
+# source) and the cheapest cost it has had to forget.  An insertion breaks one edge and
+# offers its two new ones to every city, O(n); a remembered edge is only checked for being
+# still in the tour when it is the city's best, and a city falls back on the rest of its
+# slots in O(INSERTION_SLOTS).  Only when none of them can be trusted to be the cheapest
+# (all broken, or the best left costs more than something it forgot) is the city rescored
+# against the whole tour and its slots refilled.  Past deadline the cities left are
+# dropped into their current best edges as they are.  Missing edges cost
+# INFEASIBLE_EDGE_COST, so they are used only when nothing else will do.
+INSERTION_SLOTS = 8
+
+def insertionTour( matrix, farthest=False, deadline=None ):
+	n = len(matrix)
+	if n < 3:
+		return np.arange(n)
+	d = np.where(np.isinf(matrix), INFEASIBLE_EDGE_COST, matrix)
+	cycles = d + d.T
+	np.fill_diagonal(cycles, np.inf)
+	a, b = divmod(int(np.argmin(cycles)), n)
+	nextCity = np.full(n, -1)
+	nextCity[a], nextCity[b] = b, a
+	routed = np.zeros(n, dtype = bool)
+	routed[[a, b]] = True
+	everyone = np.arange(n)
+
+	# Slots with an infinite cost are empty.  worst[c] is the slot a new edge replaces.
+	slots = min(INSERTION_SLOTS, n)
+	slotCost = np.full((n, slots), np.inf)
+	slotFrom = np.zeros((n, slots), dtype = np.intp)
+	slotTo = np.zeros((n, slots), dtype = np.intp)
+	worst = np.zeros(n, dtype = np.intp)
+	best = np.zeros(n, dtype = np.intp)
+	bestCost = np.full(n, np.inf)
+	forgotten = np.full(n, np.inf)
+	if farthest:
+		distance = np.minimum(np.minimum(d[a, :], d[:, a]), np.minimum(d[b, :], d[:, b]))
+		distance[routed] = -np.inf
+
+	def offer( u, v ):
+		cost = d[u, :] + d[:, v] - d[u, v]
+		cost[routed] = np.inf
+		worstCost = slotCost[everyone, worst]
+		take = cost < worstCost
+		np.minimum(forgotten, np.where(take, worstCost, cost), out = forgotten)
+		rows = np.flatnonzero(take)
+		if len(rows):
+			cols = worst[rows]
+			slotCost[rows, cols] = cost[rows]
+			slotFrom[rows, cols], slotTo[rows, cols] = u, v
+			worst[rows] = np.argmax(slotCost[rows], axis = 1)
+			better = cost[rows] < bestCost[rows]
+			best[rows[better]] = cols[better]
+			bestCost[rows[better]] = cost[rows[better]]
+
+	# Cities whose best edge was broken: forget their broken edges and take the best of the
+	# rest, or rescore them against the whole tour if that might miss something cheaper.
+	def refresh( rows ):
+		valid = nextCity[slotFrom[rows]] == slotTo[rows]
+		costs = np.where(valid, slotCost[rows], np.inf)
+		slotCost[rows] = costs
+		worst[rows] = np.argmax(costs, axis = 1)
+		best[rows] = np.argmin(costs, axis = 1)
+		bestCost[rows] = costs[np.arange(len(rows)), best[rows]]
+		rows = rows[bestCost[rows] > forgotten[rows]]
+		if len(rows) == 0:
+			return
+		sources = np.flatnonzero(routed)
+		targets = nextCity[sources]
+		costs = (d[sources[np.newaxis, :], rows[:, np.newaxis]] + d[rows[:, np.newaxis], targets[np.newaxis, :]]
+				 - d[sources, targets][np.newaxis, :])
+		k = min(slots, len(sources))
+		if k < len(sources):
+			kept = np.argpartition(costs, k - 1, axis = 1)[:, :k]
+		else:
+			kept = np.broadcast_to(np.arange(k), (len(rows), k))
+		keptCosts = np.take_along_axis(costs, kept, axis = 1)
+		slotCost[rows] = np.inf
+		slotCost[rows, :k] = keptCosts
+		slotFrom[rows, :k], slotTo[rows, :k] = sources[kept], targets[kept]
+		forgotten[rows] = keptCosts.max(axis = 1) if k < len(sources) else np.inf
+		worst[rows] = np.argmax(slotCost[rows], axis = 1)
+		best[rows] = np.argmin(slotCost[rows], axis = 1)
+		bestCost[rows] = slotCost[rows, best[rows]]
+
+	offer(a, b)
+	offer(b, a)
+	for step in range(n - 2):
+		if deadline is not None and step % 64 == 0 and time.time() >= deadline:
+			break
+		c = int(np.argmax(distance)) if farthest else int(np.argmin(bestCost))
+		u = slotFrom[c, best[c]]
+		v = nextCity[u]
+		nextCity[u], nextCity[c] = c, v
+		routed[c] = True
+		bestCost[c] = np.inf
+
+		stale = np.flatnonzero((slotFrom[everyone, best] == u) & (slotTo[everyone, best] == v) & ~routed)
+		offer(u, c)
+		offer(c, v)
+		if len(stale):
+			refresh(stale)
+		if farthest:
+			np.minimum(distance, np.minimum(d[c, :], d[:, c]), out = distance)
+			distance[routed] = -np.inf
+
+	for c in np.flatnonzero(~routed): # Out of time.
+		u = slotFrom[c, best[c]]
+		nextCity[u], nextCity[c] = c, nextCity[u]
+
+	tour = np.empty(n, dtype = np.intp)
+	city = a
+	for i in range(n):
+		tour[i] = city
+		city = nextCity[city]
+	return tour
+
+# Improvement heuristic for asymmetric tours.  Only moves that keep every segment's
+# direction are used, since reversing a segment changes its cost:
+#   Or-opt       - move a run of 1-3 cities to another place in the tour
+#   segment swap - the reversal-free 3-opt move: cut three edges and exchange the two
+#                  segments between them (a b' .. c a' .. b c')
+# Moves are found through k-nearest candidate lists and cities whose neighbourhood has not
+# changed since they last failed to improve are skipped (don't-look bits).  dist is a list
+# of lists so the innermost lookups are plain Python indexing (or, on scenarios too big
+# for that, a TSPNeighbors.PairCosts that computes them).  Applying a move only rewrites
+# the shorter side of the tour (see _exchange), never the whole tour.
+class LocalSearch:
+	SEGMENT_LENGTHS = (1, 2, 3)
+	EPSILON = 1e-9
+
+	def __init__( self, order, dist, candidatesOut, candidatesIn, length=None ):
+		self.dist = dist
+		self.candidatesOut = candidatesOut
+		self.candidatesIn = candidatesIn
+		self.improvements = 0
+		self.setTour(order, length)
+
+	# length, if known, saves summing the tour's edges again.
+	def setTour( self, order, length=None ):
+		self.tour = list(order)
+		self.n = len(self.tour)
+		self.pos = [0] * self.n
+		for i, city in enumerate(self.tour):
+			self.pos[city] = i
+		if length is None:
+			length = sum(self.dist[a][b] for a, b in zip(self.tour, self.tour[1:] + self.tour[:1]))
+		self.length = length
+		self._journal = None
+
+	# Start recording moves, so rollback() can return to the tour as it is now.
+	def checkpoint( self ):
+		self._journal = []
+		self._checkpointLength = self.length
+
+	# Undo every move since the last checkpoint, at the same cost as making them.
+	def rollback( self ):
+		for start, first, second in reversed(self._journal):
+			self._rotate(start, second, first)
+		self._journal = []
+		self.length = self._checkpointLength
+
+	def succ( self, city ):
+		return self.tour[(self.pos[city] + 1) % self.n]
+
+	def pred( self, city ):
+		return self.tour[self.pos[city] - 1]
+
+	# Every move here exchanges two neighbouring blocks of the tour: tour[i:j] and
+	# tour[j:k] (positions mod n, i <= j <= k <= i + n).  On a cycle, exchanging any two of
+	# the three blocks (those two and the rest of the tour) gives the same tour, so only the
+	# two shortest are rewritten, and a move costs the tour length less its longest block.
+	def _exchange( self, i, j, k ):
+		n = self.n
+		lengths = (j - i, k - j, i + n - k)
+		longest = lengths.index(max(lengths))
+		if longest == 2:
+			start, first, second = i, j - i, k - j
+		elif longest == 0:
+			start, first, second = j, k - j, i + n - k
+		else:
+			start, first, second = k, i + n - k, j - i
+		start %= n
+		if self._journal is not None:
+			self._journal.append((start, first, second))
+		self._rotate(start, first, second)
+
+	# Turn the first + second cities from position start (mod n) from A B into B A.
+	def _rotate( self, start, first, second ):
+		tour, pos, n = self.tour, self.pos, self.n
+		end = start + first + second
+		if end <= n:
+			block = tour[start + first:end] + tour[start:start + first]
+			tour[start:end] = block
+			for i, city in enumerate(block, start):
+				pos[city] = i
+		else:
+			positions = [i % n for i in range(start, end)]
+			block = [tour[i] for i in positions]
+			for i, city in zip(positions, block[first:] + block[:first]):
+				tour[i] = city
+				pos[city] = i
+
+	def _apply( self, i, j, k, delta ):
+		self._exchange(i, j, k)
+		self.length += delta
+		self.improvements += 1
+
+	# Try to move a segment starting at c somewhere cheaper.  Returns the cities whose
+	# edges changed, or None.
+	def orOpt( self, c ):
+		d = self.dist
+		p = self.pred(c)
+		segment = []
+		e = p
+		for length in self.SEGMENT_LENGTHS:
+			e = self.succ(e)
+			segment.append(e)
+			nx = self.succ(e)
+			if nx == p or length + 3 > self.n:
+				break
+			removeGain = d[p][c] + d[e][nx] - d[p][nx]
+			if removeGain <= self.EPSILON:
+				continue
+			insertions = [(u, self.succ(u)) for u in self.candidatesIn[c] if u != p and u not in segment]
+			insertions += [(self.pred(v), v) for v in self.candidatesOut[e] if v != nx and v not in segment]
+			for u, v in insertions:
+				delta = d[u][c] + d[e][v] - d[u][v] - removeGain
+				if delta < -self.EPSILON:
+					i = self.pos[c]
+					self._apply(i, i + length, i + (self.pos[u] - i) % self.n + 1, delta)
+					return [p, c, e, nx, u, v]
+		return None
+
+	# Try to replace a -> a' with a cheaper a -> b' by swapping the segments a'..b and
+	# b'..c.  Returns the cities whose edges changed, or None.
+	def segmentSwap( self, a ):
+		d, n, pos = self.dist, self.n, self.pos
+		start = pos[a]
+		a1 = self.succ(a)
+		for b1 in self.candidatesOut[a]:
+			gain = d[a][a1] - d[a][b1]
+			if gain <= self.EPSILON:
+				break # Candidates are sorted, so no later b' can do better.
+			rb1 = (pos[b1] - start) % n
+			if rb1 < 2:
+				continue
+			b = self.pred(b1)
+			gain += d[b][b1]
+			for c in self.candidatesIn[a1]:
+				rc = (pos[c] - start) % n
+				if rc < rb1:
+					continue
+				c1 = self.succ(c)
+				delta = d[c][a1] + d[b][c1] - d[c][c1] - gain
+				if delta < -self.EPSILON:
+					self._apply(start + 1, start + rb1, start + rc + 1, delta)
+					return [a, a1, b, b1, c, c1]
+		return None
+
+	# Apply improving moves until none is left among the queued cities (all of them if
+	# cities is None), the deadline passes or cancelled() says to stop.
+	def optimize( self, deadline, cities=None, cancelled=None ):
+		if self.n < 5:
+			return
+		queued = [False] * self.n
+		active = collections.deque(range(self.n) if cities is None else cities)
+		for city in active:
+			queued[city] = True
+		checks = 0
+		while active:
+			checks += 1
+			if checks % 16 == 0 and (time.time() >= deadline or (cancelled and cancelled())):
+				return
+			city = active.popleft()
+			queued[city] = False
+			touched = self.orOpt(city) or self.segmentSwap(city)
+			if touched:
+				for other in touched:
+					if not queued[other]:
+						queued[other] = True
+						active.append(other)
+
+	# Random double-bridge move (A B C D -> A C B D), which keeps segment directions.
+	# Returns the cities whose edges changed.
+	def kick( self ):
+		d = self.dist
+		t = self.tour
+		p1, p2, p3 = sorted(random.sample(range(1, self.n), 3))
+		ends = [t[p1 - 1], t[p1], t[p2 - 1], t[p2], t[p3 - 1], t[p3]]
+		aEnd, b0, bEnd, c0, cEnd, d0 = ends
+		delta = (d[aEnd][c0] + d[cEnd][b0] + d[bEnd][d0]
+				 - d[aEnd][b0] - d[bEnd][c0] - d[cEnd][d0])
+		self._exchange(p1, p2, p3)
+		self.length += delta
+		return ends
+
+
+
+# Tour state for simulated annealing, built so that any number of candidate moves can be
+# scored at once from the edges they change alone.  forward[p] is the cost of the tour's
+# first p edges and backward[p] the cost of the same edges walked the other way, so the
+# change from reversing positions i..j (its inner edges flip direction on an asymmetric
+# problem) is a difference of two prefix sums.  City tour[0] never moves.  Moves:
+#   swap      - exchange the cities at positions i and j (not next to each other)
+#   reverse   - reverse positions i..j
+#   relocate  - move positions i..j (at most three cities) to just after position k
+class AnnealingTour:
+	SWAP, REVERSE, RELOCATE = 0, 1, 2
+	MAX_RELOCATE = 3
+
+	def __init__( self, dist, tour ):
+		self.dist = dist
+		self.n = len(tour)
+		self.setTour(tour)
+
+	def setTour( self, tour ):
+		self.tour = np.array(tour, dtype = np.intp)
+		t = self.tour
+		self.forward = np.concatenate([[0.0], np.cumsum(self.dist[t[:-1], t[1:]])])
+		self.backward = np.concatenate([[0.0], np.cumsum(self.dist[t[1:], t[:-1]])])
+		self.cost = self.forward[-1] + self.dist[t[-1], t[0]]
+
+	# count random moves as (kind, i, j, k) arrays.
+	def sample( self, rng, count ):
+		n = self.n
+		kind = rng.integers(3, size = count)
+		a, b = rng.integers(1, n, size = (2, count))
+		i, j = np.minimum(a, b), np.maximum(a, b)
+		relocating = kind == self.RELOCATE
+		j[relocating] = np.minimum(i[relocating] + rng.integers(self.MAX_RELOCATE, size = count)[relocating], n - 1)
+		k = rng.integers(n, size = count)
+		return kind, i, j, k
+
+	# Change in tour cost for each move; inf for moves that don't apply (a swap of
+	# neighbours, an empty reversal, a relocation next to or into its own segment).
+	def deltas( self, kind, i, j, k ):
+		d, t, n = self.dist, self.tour, self.n
+		ti, tj = t[i], t[j]
+		before, after = t[i - 1], t[(j + 1) % n]
+		outer = d[before, ti] + d[tj, after]
+
+		ti1 = t[(i + 1) % n]
+		swap = (d[before, tj] + d[tj, ti1] + d[t[j - 1], ti] + d[ti, after]
+				- outer - d[ti, ti1] - d[t[j - 1], tj])
+		swap[j - i < 2] = np.inf
+
+		reverse = (d[before, tj] + d[ti, after] - outer
+				   + (self.backward[j] - self.backward[i]) - (self.forward[j] - self.forward[i]))
+		reverse[j == i] = np.inf
+
+		tk, tk1 = t[k], t[(k + 1) % n]
+		relocate = d[before, after] + d[tk, ti] + d[tj, tk1] - outer - d[tk, tk1]
+		relocate[(k >= i - 1) & (k <= j)] = np.inf
+
+		return np.choose(kind, (swap, reverse, relocate))
+
+	def apply( self, kind, i, j, k ):
+		t = self.tour
+		if kind == self.SWAP:
+			t = t.copy()
+			t[i], t[j] = t[j], t[i]
+		elif kind == self.REVERSE:
+			t = np.concatenate([t[:i], t[i:j + 1][::-1], t[j + 1:]])
+		elif k < i:
+			t = np.concatenate([t[:k + 1], t[i:j + 1], t[k + 1:i], t[j + 1:]])
+		else:
+			t = np.concatenate([t[:i], t[j + 1:k + 1], t[i:j + 1], t[k + 1:]])
+		self.setTour(t)
+
+
+
+# Order crossover (OX) for a batch of children at once: child k keeps a random slice of
+# first[k] in place and fills the other positions with the remaining cities in the order
+# they come in second[k].  Both parents' relative city orders survive, which is what
+# matters on an asymmetric problem (segments are never reversed).
+def orderCrossover( first, second, rng ):
+	count, n = first.shape
+	positions = np.arange(n)
+	cuts = np.sort(rng.integers(n + 1, size = (count, 2)), axis = 1)
+	kept = (positions >= cuts[:, :1]) & (positions < cuts[:, 1:])
+	where = np.empty_like(first)
+	np.put_along_axis(where, first, np.broadcast_to(positions, first.shape), axis = 1)
+	taken = np.take_along_axis(kept, np.take_along_axis(where, second, axis = 1), axis = 1)
+	# Every row has as many free positions as untaken cities, so the row-major
+	# boolean assignment lines them up row by row.
+	children = np.where(kept, first, 0)
+	children[~kept] = second[~taken]
+	return children
+
+# One population of the genetic solver.  Each step() breeds a whole generation: parents
+# by binary tournament, children by orderCrossover, a random segment move on some of
+# them, and LocalSearch on the most promising few.  All tour costs come from one gather
+# over the cost matrix (with missing edges costing INFEASIBLE_EDGE_COST, so infeasible
+# tours are ranked by how many missing edges they use rather than dropped), and the best
+# of parents and children survive, one tour per distinct cost so clones can't take over.
+class GeneticIsland:
+	MUTATION_RATE = 0.3		# fraction of children given a random segment move
+	POLISHED = 2			# children per generation improved by LocalSearch
+	NEIGHBOURS = 10			# LocalSearch candidate list length
+
+	def __init__( self, matrix, tours, rng ):
+		self.rng = rng
+		self.dist = np.where(np.isinf(matrix), INFEASIBLE_EDGE_COST, matrix)
+		self.population = np.array(tours, dtype = np.intp)
+		self.costs = IndexedTSPSolution.tourCosts(self.dist, self.population)
+		self._survive(self.population, self.costs)
+		self.generations = 0
+		self.search = None
+		if len(matrix) >= 5:
+			self.search = LocalSearch(self.population[0].tolist(), costRows(self.dist),
+									  *candidateLists(matrix, self.NEIGHBOURS))
+
+	def best( self ):
+		return self.population[0], self.costs[0]
+
+	# Keep the size of the population, best first, preferring one tour per cost.
+	def _survive( self, tours, costs ):
+		size = len(self.population)
+		_, distinct = np.unique(costs, return_index = True)
+		if len(distinct) < size:
+			rest = np.setdiff1d(np.arange(len(costs)), distinct)
+			distinct = np.concatenate([distinct, rest[np.argsort(costs[rest], kind = 'stable')]])
+		keep = distinct[:size]
+		self.population, self.costs = tours[keep], costs[keep]
+
+	def _mutate( self, tour ):
+		n = len(tour)
+		i = int(self.rng.integers(n))
+		j = min(n, i + 1 + int(self.rng.integers(3)))
+		segment, rest = tour[i:j], np.concatenate([tour[:i], tour[j:]])
+		k = int(self.rng.integers(len(rest) + 1))
+		return np.concatenate([rest[:k], segment, rest[k:]])
+
+	def step( self, deadline ):
+		size, n = self.population.shape
+		contenders = self.rng.integers(size, size = (2, 2, size))
+		parents = np.where(self.costs[contenders[:, 0]] <= self.costs[contenders[:, 1]],
+						   contenders[:, 0], contenders[:, 1])
+		children = orderCrossover(self.population[parents[0]], self.population[parents[1]], self.rng)
+		for row in np.flatnonzero(self.rng.random(size) < self.MUTATION_RATE):
+			children[row] = self._mutate(children[row])
+		costs = IndexedTSPSolution.tourCosts(self.dist, children)
+
+		if self.search is not None:
+			for row in np.argsort(costs, kind = 'stable')[:self.POLISHED]:
+				self.search.setTour(children[row].tolist(), costs[row])
+				self.search.optimize(deadline)
+				children[row], costs[row] = self.search.tour, self.search.length
+
+		self._survive(np.concatenate([self.population, children]), np.concatenate([self.costs, costs]))
+		self.generations += 1
+
+	# Take in a migrant tour from another island in place of the worst one here.
+	def accept( self, tour ):
+		tour = np.asarray(tour, dtype = np.intp)
+		tours = np.concatenate([self.population, tour[np.newaxis, :]])
+		costs = np.concatenate([self.costs, IndexedTSPSolution.tourCosts(self.dist, tour)[np.newaxis]])
+		self._survive(tours, costs)
+
+# An island in its own process (see TSPSolver.genetic).  Sends ('tour', cost, tour) on
+# resultQueue whenever its best improves, its best tour to the next island through outbox
+# every interval generations, takes in whatever arrives in inbox, and ends by sending
+# ('stats', generations).
+def _geneticIsland( matrix, tours, seed, deadline, stallLimit, inbox, outbox, resultQueue, interval ):
+	outbox.cancel_join_thread() # Migrants nobody collected must not keep this process alive.
+	island = GeneticIsland(matrix, tours, np.random.default_rng(seed))
+	bestCost = math.inf
+	stalls = 0
+	while time.time() < deadline.value and stalls < stallLimit:
+		island.step(deadline.value)
+		tour, cost = island.best()
+		if cost < bestCost:
+			bestCost, stalls = cost, 0
+			resultQueue.put(('tour', cost, tour.tolist()))
+		else:
+			stalls += 1
+		if island.generations % interval == 0:
+			outbox.put(tour.tolist())
+		while True:
+			try:
+				island.accept(inbox.get_nowait())
+			except queue.Empty:
+				break
+	resultQueue.put(('stats', island.generations))
 
 
 
 class TSPSolver:
+	PROGRESS_INTERVAL = 0.1	# seconds between progress reports (new BSSFs are always reported)
+
 	def __init__( self, gui_view ):
 		self._scenario = None
 		self.bssf = None
+		self._progress = None
+		self._lastProgress = 0.0
+		self._cancel = threading.Event()
+		self.profiling = False
+		self.profile = None
+		self.cache = None
+		self._candidates = None
+
+	# Above this many cities greedy and fancy work from a TSPNeighbors.CandidateIndex
+	# instead of the n x n cost matrix, which is never built.
+	DENSE_MAX_CITIES = Scenario.DENSE_EDGE_LIMIT
 
 	def setupWithScenario( self, scenario ):
 		self._scenario = scenario
+		self._cancel.clear()
+		self.profile = None
+		if self._candidates is not None and self._candidates[0] is not scenario:
+			self._candidates = None
+		if self.cache is not None and len(scenario.getCities()) <= self.DENSE_MAX_CITIES:
+			matrix = self.cache.get(scenario, 'matrix')
+			if matrix is None:
+				matrix = scenario.getCostMatrix()
+				self.cache.put(scenario, 'matrix', matrix, matrix.nbytes)
+			scenario._cost_matrix = matrix
+
+	# With a TSPCache.ScenarioCache set, solves reuse the cost matrix and reduced root
+	# matrix of a scenario seen before, and the searches start from the best tour any
+	# earlier solve of it found instead of running greedy.
+	def setCache( self, cache ):
+		self.cache = cache
+
+	# Fill self.bssf with a tour to start searching from: the best of greedy and the two
+	# insertion constructions (just greedy over DENSE_MAX_CITIES cities).
+	# Searches spend at most this fraction of their time allowance on _initialBSSF.
+	INITIAL_BSSF_SHARE = 0.2
+
+	# All the constructions together take about time_allowance (greedy always finishes at
+	# least one tour); an insertion that runs out of time still finishes its tour.
+	def _initialBSSF( self, time_allowance=60.0 ):
+		if self.cache is not None:
+			known = self.cache.get(self._scenario, 'tour')
+			if known is not None:
+				self.bssf = IndexedTSPSolution(self._scenario, known)
+				return
+		deadline = time.time() + time_allowance
+		self.greedy(time_allowance)
+		if len(self._scenario.getCities()) <= self.DENSE_MAX_CITIES:
+			best = self.bssf
+			for construction in (self.cheapestInsertion, self.farthestInsertion):
+				if time.time() >= deadline or self.cancelled():
+					break
+				construction(deadline - time.time())
+				if self.bssf.cost < best.cost:
+					best = self.bssf
+			self.bssf = best
+
+	# The scenario's CandidateIndex (FANCY_NEIGHBOURS candidates per city), built once
+	# per scenario and kept in the cache if there is one.  An index cut short by deadline
+	# is not kept, so the next call builds it again.
+	def _candidateIndex( self, deadline=None ):
+		if self._candidates is not None and self._candidates[1].complete:
+			return self._candidates[1]
+		index = self.cache.get(self._scenario, 'candidates') if self.cache is not None else None
+		if index is None:
+			index = CandidateIndex(self._scenario, self.FANCY_NEIGHBOURS, deadline)
+			if self.cache is not None and index.complete:
+				nbytes = sum(array.nbytes for array in (index.neighbors, index.costs, index.incoming, index.incomingCosts))
+				self.cache.put(self._scenario, 'candidates', index, nbytes)
+		self._candidates = (self._scenario, index)
+		return index
+
+	# Offer a finished solve's tour to the cache as the scenario's best known one.
+	def _remember( self, soln ):
+		if self.cache is None or soln is None or soln.cost == math.inf:
+			return
+		known = self.cache.peek(self._scenario, 'tour')
+		if known is None or soln.cost < IndexedTSPSolution(self._scenario, known).cost:
+			order = soln.order if isinstance(soln, IndexedTSPSolution) else np.array([city._index for city in soln.route])
+			self.cache.put(self._scenario, 'tour', order, order.nbytes)
+
+	# With profiling on, greedy and branchAndBound time their phases and sample their
+	# progress into a Profiler, left in self.profile and returned as results['profile'].
+	def setProfiling( self, enabled ):
+		self.profiling = enabled
+
+	# The Profiler to record into, or None with profiling off.  A solver called from
+	# inside another (greedy from branchAndBound) records into the caller's profile;
+	# owner says whether this call started it (and so should finish it).
+	def _startProfile( self, name ):
+		if not self.profiling:
+			return None, False
+		if self.profile is not None and self.profile.running:
+			return self.profile, False
+		self.profile = Profiler(name)
+		return self.profile, True
+
+	# callback(event) is called on the solving thread while a solver runs.  event is a dict
+	# with the elapsed 'time' and whichever results counters ('count', 'max', 'total',
+	# 'pruned') the solver keeps; when the solver has a new best tour it also holds it as
+	# 'soln', with its 'cost'.  Pass None to stop reporting.
+	def setProgressCallback( self, callback ):
+		self._progress = callback
+
+	# Asks the running solver (from another thread) to stop as soon as it can and return
+	# the best it has so far, as if its time had run out.  Cleared by setupWithScenario.
+	def cancel( self ):
+		self._cancel.set()
+
+	def cancelled( self ):
+		return self._cancel.is_set()
+
+	def _report( self, start_time, soln=None, **counters ):
+		if self._progress is None:
+			return
+		now = time.time()
+		if soln is None and now - self._lastProgress < self.PROGRESS_INTERVAL:
+			return
+		self._lastProgress = now
+		event = dict(counters, time=now - start_time)
+		if soln is not None:
+			event['soln'] = soln
+			event['cost'] = soln.cost
+		self._progress(event)
 
 
 	''' <summary>
@@ -50,19 +1059,18 @@ class TSPSolver:
 		count = 0
 		bssf = None
 		start_time = time.time()
-		while not foundTour and time.time()-start_time < time_allowance:
+		while not foundTour and time.time()-start_time < time_allowance and not self.cancelled():
 			# create a random permutation
 			perm = np.random.permutation( ncities )
-			route = []
-			# Now build the route using the random permutation
-			for i in range( ncities ):
-				route.append( cities[ perm[i] ] )
-			bssf = TSPSolution(route)
+			bssf = IndexedTSPSolution(self._scenario, perm)
 			count += 1
 			if bssf.cost < np.inf:
 				# Found a valid route
 				foundTour = True
+				self._report(start_time, bssf, count=count)
 		end_time = time.time()
+		if foundTour:
+			self._remember(bssf)
 		results['cost'] = bssf.cost if foundTour else math.inf
 		results['time'] = end_time - start_time
 		results['count'] = count
@@ -72,31 +1080,30 @@ class TSPSolver:
 		results['pruned'] = None
 		return results
 
-	# Create a matrix of distances, and make it reduced-cost if needed.
+	# Create a matrix of distances, and make it reduced-cost if needed.  The reduced matrix
+	# comes from (and goes into) the cache if there is one, and is then read-only.
 	def createMatrix(self, reduce):
+		if reduce and self.cache is not None:
+			root = self.cache.get(self._scenario, 'root')
+			if root is not None:
+				return root
 		lowerBound = 0
-		ncities = len(self._scenario._cities)
-		matrix = np.empty((ncities, ncities))
-		matrix.fill(np.inf)
-		
-		# Add the path distances into the matrix.
-		for i in range(0, ncities):
-			for j in range(0, ncities):
-				if self._scenario._edge_exists[i, j]:
-					matrix[i, j] = self._scenario._cities[i].costTo(self._scenario._cities[j])
+		# Start from the scenario's precomputed path distances (it is read-only, so copy it).
+		matrix = np.array(self._scenario.getCostMatrix())
 		
 		# Reduce the matrix if needed.
 		if reduce:
 			rowMins = np.amin(matrix, axis = 1)
-			for i in range(0, ncities):
-				matrix[i, :] -= rowMins[i]
-				lowerBound += rowMins[i]
+			matrix -= rowMins[:, np.newaxis]
+			lowerBound += np.sum(rowMins)
 			
 			colMins = np.amin(matrix, axis = 0)
-			for i in range(0, ncities):
-				if colMins[i] > 0:
-					matrix[:, i] -= colMins[i]
-					lowerBound += colMins[i]
+			matrix -= colMins[np.newaxis, :]
+			lowerBound += np.sum(colMins)
+
+			if self.cache is not None:
+				matrix.flags.writeable = False
+				self.cache.put(self._scenario, 'root', (matrix, lowerBound), matrix.nbytes)
 		
 		return matrix, lowerBound
 		
@@ -106,51 +1113,291 @@ class TSPSolver:
 		the group project (but it is probably a good idea to just do it for the branch-and
 		bound project as a way to get your feet wet).  Note this could be used to find your
 		initial BSSF.
+		Nearest-neighbour tours are grown from every start city at once (or from a random
+		sample of them on big problems, capped by GREEDY_MAX_STARTS and GREEDY_MAX_WORK),
+		one step of all tours per array operation.  A tour that reaches a city with no way
+		on (possible in hard mode) is handed to _greedyRepair, which backtracks a limited
+		number of steps.  Scenarios over DENSE_MAX_CITIES go to _sparseGreedy instead.
 		</summary>
 		<returns>results dictionary for GUI that contains three ints: cost of best solution,
 		time spent to find best solution, total number of solutions found, the best
 		solution found, and three null values for fields not used for this
-		algorithm</returns>
+		algorithm.  'starts' maps each start city tried to the cost of its tour and
+		'repaired' counts the tours that needed backtracking.</returns>
 	'''
 
+	GREEDY_MAX_STARTS = 100
+	GREEDY_MAX_WORK = 10**8	# matrix entries scanned by all starts together before sampling fewer
+	GREEDY_REPAIR_STEPS = 10	# backtracking budget per repaired tour, in multiples of ncities
+
 	# This is used as my initial BSSF.
-	def greedy( self,time_allowance=60.0 ):
+	def greedy( self,time_allowance=60.0, starts=None ):
 		start_time = time.time()
+		profile, ownProfile = self._startProfile('greedy')
+		if profile: t = profile.clock()
 		results = {}
-		ncities = len(self._scenario._cities)
-		matrix, lowerBound = self.createMatrix(False)
-		total = 1
-		
-		currentIndex = 0
-		path = []
-		path.append(self._scenario._cities[currentIndex])
-		# While not all cities have been visited, this algorithm finds the next shortest path,
-		# and sets unavailable paths to infinity.
-		while len(path) < ncities:
-			matrix[currentIndex, 0] = np.inf
-			nextMin = np.amin(matrix[currentIndex, :])
-			lowerBound += nextMin
-			nextIndex = np.where(matrix[currentIndex, :] == nextMin)[0][0]
-			path.append(self._scenario._cities[nextIndex])
-			matrix[:, nextIndex] += np.repeat(np.inf, ncities)
-			matrix[currentIndex, :] += np.repeat(np.inf, ncities)
-			currentIndex = nextIndex
-			total += 1
-		
-		if matrix[currentIndex, 0] == np.inf: # Check if the path is viable or not.
-			self.bssf = TSPSolution([self._scenario._cities[0], self._scenario._cities[0]])
+		cities = self._scenario._cities
+		ncities = len(cities)
+		if ncities > self.DENSE_MAX_CITIES:
+			return self._sparseGreedy(time_allowance, starts, start_time, profile, ownProfile)
+		matrix = self._scenario.getCostMatrix()
+		if profile: t = profile.add('matrix build', t)
+
+		if starts is None:
+			nstarts = min(self.GREEDY_MAX_STARTS, max(1, self.GREEDY_MAX_WORK // ncities**2))
+			if ncities <= nstarts:
+				starts = np.arange(ncities)
+			else:
+				starts = np.sort(np.random.choice(ncities, nstarts, replace = False))
+		starts = np.asarray(starts)
+		ntours = len(starts)
+		tours = np.empty((ntours, ncities), dtype = np.intp)
+		tours[:, 0] = starts
+		visited = np.zeros((ntours, ncities), dtype = bool)
+		visited[np.arange(ntours), starts] = True
+		stuckAt = np.full(ntours, ncities) # Length of each tour when it hit a dead end.
+		rows = np.empty((ntours, ncities))
+
+		# Advance every tour one city per pass, always to its nearest unvisited city.
+		for step in range(1, ncities):
+			np.take(matrix, tours[:, step - 1], axis = 0, out = rows)
+			np.copyto(rows, np.inf, where = visited)
+			nextCities = np.argmin(rows, axis = 1)
+			stuck = (rows[np.arange(ntours), nextCities] == np.inf) & (stuckAt == ncities)
+			stuckAt[stuck] = step
+			tours[:, step] = nextCities
+			visited[np.arange(ntours), nextCities] = True
+		if profile: t = profile.add('greedy tours', t, ntours)
+		closed = (stuckAt == ncities) & (matrix[tours[:, -1], starts] < np.inf)
+		stuckAt[(stuckAt == ncities) & ~closed] = ncities - 1
+		total = int(np.sum(stuckAt))
+
+		costs = np.full(ntours, np.inf)
+		costs[closed] = IndexedTSPSolution.tourCosts(matrix, tours[closed])
+		if profile: t = profile.add('tour costs', t)
+		repaired = 0
+		for k in np.flatnonzero(~closed):
+			if time.time() - start_time >= time_allowance or self.cancelled():
+				break
+			tour, steps = self._greedyRepair(matrix, tours[k, :stuckAt[k]], self.GREEDY_REPAIR_STEPS * ncities)
+			total += steps
+			if tour is not None:
+				tours[k] = tour
+				costs[k] = IndexedTSPSolution.tourCosts(matrix, tour)
+				repaired += 1
+			if profile: t = profile.add('greedy repair', t)
+
+		best = int(np.argmin(costs))
+		if costs[best] < np.inf:
+			route = tours[best]
 		else:
-			self.bssf = TSPSolution(path)
-		
+			# Nothing worked out: fall back to the first tour, finished off in index order.
+			prefix = tours[0, :stuckAt[0]]
+			route = np.concatenate([prefix, np.setdiff1d(np.arange(ncities), prefix)])
+		self.bssf = IndexedTSPSolution(self._scenario, route)
+		if profile:
+			profile.add('solution', t)
+			profile.sample(True, bssf=self.bssf.cost)
+		self._report(start_time, self.bssf, count=int(np.sum(costs < np.inf)), total=total)
+		self._remember(self.bssf)
+
 		end_time = time.time()
-		
+
 		results['cost'] = self.bssf.cost
 		results['time'] = end_time - start_time
-		results['count'] = None
+		results['count'] = int(np.sum(costs < np.inf))
+		results['soln'] = self.bssf
+		results['max'] = None
+		results['total'] = total
+		results['pruned'] = None
+		results['starts'] = dict(zip(starts.tolist(), costs.tolist()))
+		results['repaired'] = repaired
+		if ownProfile:
+			profile.finish()
+			results['profile'] = profile
+		return results
+
+	# greedy for scenarios too big for the cost matrix: a nearest-neighbour tour from each
+	# start city in turn (one random start unless given) until time runs out, walking the
+	# candidate lists and asking CandidateIndex.cheapestFrom once a city's candidates are
+	# all visited.  A dead end is crossed to the lowest-numbered unvisited city over a
+	# missing edge, and _sparseRepair then tries to move the missing edges out of the tour.
+	def _sparseGreedy( self, time_allowance, starts, start_time, profile, ownProfile ):
+		deadline = start_time + time_allowance
+		if profile: t = profile.clock()
+		index = self._candidateIndex(deadline)
+		if profile: t = profile.add('candidate index', t)
+		ncities = index.ncities
+		neighbors, costs = index.neighbors.tolist(), index.costs.tolist()
+		if starts is None:
+			starts = [np.random.randint(ncities)]
+		starts = [int(start) for start in starts]
+
+		tried, best, total, repaired = {}, None, 0, 0
+		for start in starts:
+			if tried and (time.time() - start_time >= time_allowance or self.cancelled()):
+				break
+			visited = np.zeros(ncities, dtype = bool)
+			tour = [start]
+			visited[start] = True
+			city = start
+			for step in range(1, ncities):
+				if step % 256 == 0 and (self.cancelled() or time.time() >= deadline):
+					tour += np.flatnonzero(~visited).tolist() # Finish off in index order.
+					break
+				nextCity = -1
+				for other, cost in zip(neighbors[city], costs[city]):
+					if cost == math.inf:
+						break
+					if not visited[other]:
+						nextCity = other
+						break
+				if nextCity < 0:
+					nextCity = index.cheapestFrom(city, visited)
+					if nextCity < 0:
+						nextCity = int(np.argmin(visited))
+				tour.append(nextCity)
+				visited[nextCity] = True
+				city = nextCity
+			total += ncities
+			soln = IndexedTSPSolution(self._scenario, tour)
+			if soln.cost == math.inf:
+				soln = IndexedTSPSolution(self._scenario, self._sparseRepair(soln.order))
+				repaired += soln.cost < math.inf
+			tried[start] = soln.cost
+			if best is None or soln.cost < best.cost:
+				best = soln
+				self._report(start_time, best, total=total)
+			if profile: t = profile.add('greedy tours', t)
+
+		self.bssf = best
+		if profile:
+			profile.sample(True, bssf=self.bssf.cost)
+		self._remember(self.bssf)
+		count = sum(cost < math.inf for cost in tried.values())
+
+		results = {}
+		results['cost'] = self.bssf.cost
+		results['time'] = time.time() - start_time
+		results['count'] = count
 		results['soln'] = self.bssf
 		results['max'] = None
 		results['total'] = total
 		results['pruned'] = None
+		results['starts'] = tried
+		results['repaired'] = repaired
+		if ownProfile:
+			profile.finish()
+			results['profile'] = profile
+		return results
+
+	SPARSE_REPAIR_MOVES = 10
+
+	# Takes up to SPARSE_REPAIR_MOVES missing edges a -> b out of tour, each by moving b
+	# (or failing that a) to the cheapest spot where both its new edges exist.
+	def _sparseRepair( self, tour ):
+		scenario = self._scenario
+		tour = np.array(tour)
+		for move in range(self.SPARSE_REPAIR_MOVES):
+			missing = np.flatnonzero(~scenario.edgeExists(tour, np.roll(tour, -1)))
+			if len(missing) == 0:
+				break
+			p = missing[0]
+			for q in ((p + 1) % len(tour), p):
+				city = tour[q]
+				rest = np.delete(tour, q)
+				after = np.roll(rest, -1)
+				removed = scenario.pairCosts(rest, after)
+				costs = scenario.pairCosts(rest, city) + scenario.pairCosts(city, after) - np.where(np.isinf(removed), 0.0, removed)
+				spot = int(np.argmin(costs))
+				if costs[spot] < math.inf:
+					moved = np.insert(rest, spot + 1, city)
+					if np.count_nonzero(~scenario.edgeExists(moved, np.roll(moved, -1))) < len(missing):
+						tour = moved
+						break
+			else:
+				break
+		return tour
+
+	# Depth-first search for a complete tour that extends prefix, trying the nearest
+	# unvisited city first and backtracking (into the prefix too) on dead ends.  Gives up
+	# after budget steps.  Returns (tour or None, steps taken).
+	def _greedyRepair( self, matrix, prefix, budget ):
+		ncities = len(matrix)
+		path = list(prefix)
+		visited = np.zeros(ncities, dtype = bool)
+		visited[path] = True
+		options = [None] * (ncities + 1) # Untried cities for each position, nearest last.
+
+		def nearest( city ):
+			row = matrix[city]
+			candidates = np.flatnonzero((row < np.inf) & ~visited)
+			return candidates[np.argsort(-row[candidates], kind = 'stable')].tolist()
+
+		steps = 0
+		while steps < budget:
+			if len(path) == ncities:
+				if matrix[path[-1], path[0]] < np.inf:
+					return np.array(path), steps
+			else:
+				if options[len(path)] is None:
+					options[len(path)] = nearest(path[-1])
+				if options[len(path)]:
+					city = options[len(path)].pop()
+					path.append(city)
+					visited[city] = True
+					steps += 1
+					continue
+
+			# Dead end: give up on the last city and try the next option in its place.
+			options[len(path)] = None
+			if len(path) <= 1:
+				break
+			last = path.pop()
+			visited[last] = False
+			if options[len(path)] is None: # Backing into the greedy prefix.
+				options[len(path)] = nearest(path[-1])
+				options[len(path)].remove(last)
+		return None, steps
+
+
+
+	''' <summary>
+		Insertion constructions (see insertionTour).  cheapestInsertion grows the tour by
+		whichever city is cheapest to add, farthestInsertion by the city furthest from the
+		tour, which tends to settle the tour's overall shape first; both put each city where
+		it adds the least.  Once time_allowance is used up, the cities still left are put
+		into their current best places without further scoring.  They need the cost matrix,
+		so are meant for scenarios of up to DENSE_MAX_CITIES cities.  _initialBSSF starts
+		the searches from the best of these and greedy.
+		</summary>
+		<returns>results dictionary for GUI in the same form as greedy's; count is 1 if the
+		tour is feasible and 0 if it had to use a missing edge.</returns>
+	'''
+
+	def cheapestInsertion( self, time_allowance=60.0 ):
+		return self._insertion(False, time_allowance)
+
+	def farthestInsertion( self, time_allowance=60.0 ):
+		return self._insertion(True, time_allowance)
+
+	def _insertion( self, farthest, time_allowance ):
+		start_time = time.time()
+		results = {}
+		matrix = self._scenario.getCostMatrix()
+		self.bssf = IndexedTSPSolution(self._scenario, insertionTour(matrix, farthest, start_time + time_allowance))
+		count = int(self.bssf.cost < math.inf)
+		self._report(start_time, self.bssf, count=count)
+		self._remember(self.bssf)
+		end_time = time.time()
+
+		results['cost'] = self.bssf.cost
+		results['time'] = end_time - start_time
+		results['count'] = count
+		results['soln'] = self.bssf
+		results['max'] = None
+		results['total'] = None
+		results['pruned'] = None
 		return results
 
 
@@ -161,100 +1408,232 @@ class TSPSolver:
 		<returns>results dictionary for GUI that contains three ints: cost of best solution,
 		time spent to find best solution, total number solutions found during search (does
 		not include the initial BSSF), the best solution found, and three more ints:
-		max queue size, total number of states created, and number of pruned states.</returns>
+		max queue size, total number of states created, and number of pruned states.
+		'first' is the number of seconds until the search first beat the initial BSSF
+		(None if it never did), and 'optimal' says whether the search proved the BSSF
+		optimal (False if it timed out or had to drop states to stay under its memory cap).
+		'bytes' is the most memory the queued states kept alive at once (see BBState.retained).</returns>
 	'''
 
-	def branchAndBound( self, time_allowance=60.0 ):
+	# Search strategies for branchAndBound:
+	#   'best'   - always expand the state with the lowest bound
+	#   'dfs'    - always expand the deepest state, cheapest bound first among equals
+	#   'hybrid' - rank states by bound minus a bonus for depth, and every
+	#              HYBRID_DIVE_INTERVAL expansions dive depth-first from the best state
+	SEARCH_STRATEGIES = ('best', 'dfs', 'hybrid')
+	HYBRID_DEPTH_WEIGHT = 0.5		# depth bonus per level, as a fraction of the root bound's average edge
+	HYBRID_DIVE_INTERVAL = 100
+
+	# When the BSSF improves by at least this fraction since the last purge, every queued
+	# state that can no longer beat it is thrown out right away instead of when it is popped.
+	PURGE_IMPROVEMENT = 0.01
+
+	# The frontier is capped at max_states states and at max_bytes bytes of what its states
+	# keep alive (BBState.retained).  On overflow the search first switches to depth-first
+	# if overflow is 'dfs' (which keeps the frontier small from then on), then throws out
+	# the states that can no longer beat the BSSF and, if the frontier is still over a cap,
+	# keeps only the best-bound states up to OVERFLOW_KEEP of each cap.  Either way the
+	# result is no longer guaranteed optimal.
+	MAX_FRONTIER_BYTES = 2 * 1024**3
+	OVERFLOW_POLICIES = ('drop', 'dfs')
+	OVERFLOW_KEEP = 0.5
+
+	# Lower bounds branchAndBound can use; a bound object with root() and expand() methods
+	# (see ReductionBound) can be passed instead of a name.
+	BOUNDS = {'reduction': ReductionBound, 'assignment': AssignmentBound}
+
+	def _bounder( self, bound, incremental ):
+		if not isinstance(bound, str):
+			return bound
+		if bound not in self.BOUNDS:
+			raise ValueError('Unknown bound: {}'.format(bound))
+		return self.BOUNDS[bound](incremental)
+
+	def branchAndBound( self, time_allowance=60.0, strategy='best', bound='reduction', incremental=False,
+						max_states=None, max_bytes=MAX_FRONTIER_BYTES, overflow='drop' ):
+		bounder = self._bounder(bound, incremental)
+		if strategy not in self.SEARCH_STRATEGIES:
+			raise ValueError('Unknown search strategy: {}'.format(strategy))
+		if overflow not in self.OVERFLOW_POLICIES:
+			raise ValueError('Unknown overflow policy: {}'.format(overflow))
 		start_time = time.time()
+		profile, ownProfile = self._startProfile('branchAndBound')
+		bounder.profile = profile
+		if profile: t = profile.clock()
 		results = {}
 		ncities = len(self._scenario._cities)
 		matrix, lowerBound = self.createMatrix(True)
+		if profile: t = profile.add('matrix build', t)
 		count = 0
 		pruned = 0
 		total = 1
+		firstTime = None
 		
-		self.greedy() # Run the greedy algorithm to fill self.bssf for use later.
+		self._initialBSSF(time_allowance * self.INITIAL_BSSF_SHARE) # The best construction (or the best known tour) fills self.bssf for use later.
 		
+		# The heap holds (priority, tie-breaker, state); the tie-breaker is a plain counter so
+		# equal priorities never fall through to comparing states.
 		heap = []
-		hashMap = {} # Used to store other data from the priority queue that I didn't want messing up the ordering.
+		tieBreaker = itertools.count()
 		maxHeapSize = 0
-		currentIndex = 0
-		path = []
-		path.append(self._scenario._cities[currentIndex])
-		for i in range(1, ncities):
-			total += 1
-			tempBound = lowerBound + matrix[currentIndex, i]
-			tempMatrix = matrix.copy()
-			tempMatrix[:, i] += np.repeat(np.inf, ncities)
-			tempMatrix[currentIndex, :] += np.repeat(np.inf, ncities)
-			rowMins = np.amin(tempMatrix, axis = 1)
-			tempPath = path + [self._scenario._cities[i]]
-   
-			for j in range(0, ncities):
-				if rowMins[j] == np.inf:
-					continue
-				tempMatrix[j, :] -= np.repeat(rowMins[j], ncities)
-				tempBound += rowMins[j]
-    
-			if tempBound < self.bssf.cost:
-				tempID = str(uuid.uuid1()) # Create an ID for hashing data.
-				hashMap[tempID] = (i, tempMatrix.copy(), tempPath) # Add important data to hashmap.
-				heapq.heappush(heap, (tempBound, tempID)) # Add current path cost to queue, with associated hash.
-				if maxHeapSize < len(heap):
-					maxHeapSize = len(heap)
+		depthBonus = self.HYBRID_DEPTH_WEIGHT * lowerBound / ncities
+		maxStates = max_states if max_states is not None else np.inf
+		frontierBytes = 0
+		peakBytes = 0
+		lostOptimality = False
+		purgeCost = self.bssf.cost
+
+		def priority( state ):
+			if strategy == 'dfs':
+				return (-state.depth, state.bound)
+			elif strategy == 'hybrid':
+				return state.bound - depthBonus * state.depth
+			return state.bound
+
+		def push( state ):
+			nonlocal maxHeapSize, frontierBytes, peakBytes
+			if profile: t = profile.clock()
+			heapq.heappush(heap, (priority(state), next(tieBreaker), state))
+			if profile: profile.add('heap push', t)
+			frontierBytes += state.retained()
+			if maxHeapSize < len(heap):
+				maxHeapSize = len(heap)
+			if len(heap) > maxStates or frontierBytes > max_bytes:
+				overflowed()
+			if peakBytes < frontierBytes:
+				peakBytes = frontierBytes
+
+		def pop():
+			nonlocal frontierBytes
+			_, _, state = heapq.heappop(heap)
+			frontierBytes -= state.retained()
+			return state
+
+		# Keep only the queued states that satisfy keep(state).
+		def filterHeap( keep ):
+			nonlocal frontierBytes
+			kept = []
+			for entry in heap:
+				if keep(entry[2]):
+					kept.append(entry)
+				else:
+					frontierBytes -= entry[2].retained()
+					entry[2].release()
+			dropped = len(heap) - len(kept)
+			heap[:] = kept
+			heapq.heapify(heap)
+			return dropped
+
+		def purge():
+			nonlocal pruned, purgeCost
+			if profile: t = profile.clock()
+			purgeCost = self.bssf.cost
+			pruned += filterHeap(lambda state: state.bound < purgeCost)
+			if profile: profile.add('purge', t)
+
+		def overflowed():
+			nonlocal strategy, lostOptimality, pruned
+			lostOptimality = True
+			if strategy != 'dfs' and overflow == 'dfs':
+				strategy = 'dfs'
+				heap[:] = [(priority(entry[2]),) + entry[1:] for entry in heap]
+				heapq.heapify(heap)
+			purge()
+			if len(heap) > maxStates or frontierBytes > max_bytes:
+				kept = set()
+				size = 0
+				for entry in sorted(heap, key=lambda entry: entry[2].bound):
+					size += entry[2].retained()
+					if kept and (len(kept) >= maxStates * self.OVERFLOW_KEEP or size > max_bytes * self.OVERFLOW_KEEP):
+						break
+					kept.add(id(entry[2]))
+				pruned += filterHeap(lambda state: id(state) in kept)
+
+		# Expand a state, updating the BSSF if one of its children closes a tour, and
+		# return the children that still need to be searched.
+		def expand( current ):
+			nonlocal count, total, pruned, firstTime
+			considered, children = bounder.expand(current, ncities, self.bssf.cost)
+			current.release() # Expanded states only keep what their children's paths need.
+			total += considered
+			pruned += considered - len(children)
+			states = []
+			for child in children:
+				if child.matrix is None: # A full path was made, so update the BSSF.
+					if profile: t = profile.clock()
+					self.bssf = IndexedTSPSolution(self._scenario, current.path())
+					if profile: profile.add('solution', t)
+					count += 1
+					if firstTime is None:
+						firstTime = time.time() - start_time
+					self._report(start_time, self.bssf, count=count, max=maxHeapSize, total=total, pruned=pruned)
+					if self.bssf.cost <= purgeCost * (1.0 - self.PURGE_IMPROVEMENT):
+						purge()
+				else:
+					states.append(child)
+			return states
+
+		# Follow the cheapest child down until the path closes or dies, leaving its
+		# siblings on the queue for later.
+		def dive( current ):
+			nonlocal pruned
+			while current is not None and time.time() - start_time < time_allowance and not self.cancelled():
+				if current.bound >= self.bssf.cost:
+					pruned += 1
+					current.release()
+					return
+				children = sorted(expand(current), key=lambda state: state.bound)
+				for child in children[1:]:
+					push(child)
+				current = children[0] if children else None
+			if current is not None:
+				push(current)
+
+		# Queue size, BSSF and the lowest bound left on the queue, for the profile.
+		def sample( force=False ):
+			if strategy == 'best' or not heap:
+				lowest = heap[0][2].bound if heap else None
 			else:
-				pruned += 1
+				lowest = min(entry[2].bound for entry in heap)
+			profile.sample(force, heap=len(heap), bssf=self.bssf.cost, bound=lowest)
+
+		push(bounder.root(matrix, lowerBound))
+		expansions = 0
 		
 		# Expand values from the queue until best path found or time runs out.
-		# This code is very similar to the block above.
-		while heap and time.time() - start_time < time_allowance:
-			currentBound, currentID = heapq.heappop(heap) # Pop off the queue.
-			currentIndex, currentMatrix, currentPath = hashMap[currentID] # Retrieve data from the hash table.
-			if currentBound > self.bssf.cost:
+		while heap and time.time() - start_time < time_allowance and not self.cancelled():
+			self._report(start_time, count=count, max=maxHeapSize, total=total, pruned=pruned)
+			if profile:
+				if profile.due():
+					sample()
+				t = profile.clock()
+			current = pop() # Pop off the queue.
+			if profile: profile.add('heap pop', t)
+			if current.bound > self.bssf.cost:
 				pruned += 1
+				current.release()
 				continue
-   
-			for i in range(0, ncities):
-				if i == currentIndex: # No need to check paths to itself.
-					continue
-				if i == 0 and len(currentPath) != ncities: # If it's not at the end, don't check the first location.
-					continue
-				total += 1
-				tempBound = currentBound + currentMatrix[currentIndex, i]
-				tempMatrix = currentMatrix.copy()
-				# Infinite out blocked paths, and find the minimum values from each row.
-				tempMatrix[:, i] += np.repeat(np.inf, ncities)
-				tempMatrix[currentIndex, :] += np.repeat(np.inf, ncities)
-				rowMins = np.amin(tempMatrix, axis = 1)
-				# Add to the path.
-				tempPath = currentPath + [self._scenario._cities[i]]
-    
-				for j in range(0, ncities):
-					if rowMins[j] == np.inf:
-						continue
-					tempMatrix[j, :] -= np.repeat(rowMins[j], ncities)
-					tempBound += rowMins[j]
-     
-				if tempBound < self.bssf.cost:
-					if len(tempPath) == ncities + 1 and i == 0: # See if a full path was made, and then update BSSF.
-						del tempPath[-1] # Take off the last value since it's a repeat.
-						self.bssf = TSPSolution(tempPath)
-						count += 1
-					else:
-						tempID = str(uuid.uuid1()) # Add to the queue.
-						hashMap[tempID] = (i, tempMatrix.copy(), tempPath)
-						heapq.heappush(heap, (tempBound, tempID))
-						if maxHeapSize < len(heap):
-							maxHeapSize = len(heap)
-				else:
-					pruned += 1
+			
+			if strategy == 'hybrid' and expansions % self.HYBRID_DIVE_INTERVAL == 0:
+				dive(current)
+			else:
+				for child in expand(current):
+					push(child)
+			expansions += 1
 		
 		end_time = time.time()
+		self._remember(self.bssf)
+		if profile:
+			sample(True)
+			bounder.profile = None
   
+		optimal = not lostOptimality
 		while heap:
-			bound, ID = heapq.heappop(heap)
-			if bound > self.bssf.cost:
+			state = pop()
+			if state.bound > self.bssf.cost:
 				pruned += 1
+			elif state.bound < self.bssf.cost:
+				optimal = False
 			
 		results['cost'] = self.bssf.cost
 		results['time'] = end_time - start_time
@@ -263,18 +1642,638 @@ class TSPSolver:
 		results['max'] = maxHeapSize
 		results['total'] = total
 		results['pruned'] = pruned
+		results['first'] = firstTime
+		results['optimal'] = optimal
+		results['bytes'] = peakBytes
+		if ownProfile:
+			profile.finish()
+			results['profile'] = profile
+		return results
+
+
+
+	''' <summary>
+		Exact Held-Karp dynamic program.  best[S, j] is the cheapest path that starts at
+		city 0, visits exactly the cities in bitmask S (over cities 1..n-1) and ends at j;
+		each subset size is computed from the one below it as whole-array operations over
+		the cost matrix.  The tables take 2^(n-1) * (n-1) * 5 bytes, so instances whose
+		tables would exceed max_bytes are refused, and the temporary arrays are built in
+		chunks of at most HELD_KARP_CHUNK entries.
+		</summary>
+		<returns>results dictionary for GUI with the optimal tour (or a None solution and
+		infinite cost if the instance is too big or time runs out); total is the number of
+		table entries filled in.</returns>
+	'''
+
+	HELD_KARP_MAX_BYTES = 1024**3
+	HELD_KARP_CHUNK = 2**22
+
+	# Bytes of table the Held-Karp solver needs for an ncities problem.
+	@staticmethod
+	def heldKarpBytes( ncities ):
+		m = max(ncities - 1, 0)
+		return (2**m) * m * (np.dtype(np.float32).itemsize + np.dtype(np.int8).itemsize) + 2**m
+
+	def heldKarp( self, time_allowance=60.0, max_bytes=HELD_KARP_MAX_BYTES ):
+		start_time = time.time()
+		results = {}
+		cities = self._scenario.getCities()
+		ncities = len(cities)
+		matrix = self._scenario.getCostMatrix()
+		order = None
+		total = 0
+
+		if ncities < 3:
+			order = list(range(ncities))
+		elif self.heldKarpBytes(ncities) <= max_bytes:
+			m = ncities - 1
+			costs = matrix[1:, 1:].astype(np.float32)
+			best = np.full((2**m, m), np.inf, dtype=np.float32)
+			parent = np.full((2**m, m), -1, dtype=np.int8)
+			bits = 1 << np.arange(m)
+			best[bits, np.arange(m)] = matrix[0, 1:]
+			total = m
+
+			# Number of cities in each subset, built up one bit at a time.
+			sizes = np.zeros(2**m, dtype=np.int8)
+			for b in range(m):
+				sizes[bits[b]:2 * bits[b]] = sizes[:bits[b]] + 1
+
+			rowsPerChunk = max(1, self.HELD_KARP_CHUNK // m)
+			for size in range(2, m + 1):
+				if time.time() - start_time >= time_allowance or self.cancelled():
+					break
+				self._report(start_time, total=total)
+				layer = np.flatnonzero(sizes == size)
+				for j in range(m):
+					subsets = layer[(layer & bits[j]) != 0]
+					for chunk in range(0, len(subsets), rowsPerChunk):
+						ending = subsets[chunk:chunk + rowsPerChunk]
+						candidates = best[ending ^ bits[j]] + costs[:, j]
+						parent[ending, j] = np.argmin(candidates, axis = 1)
+						best[ending, j] = candidates[np.arange(len(ending)), parent[ending, j]]
+					total += len(subsets)
+			else:
+				# Close the cheapest full path back to city 0, then walk the parents back.
+				full = 2**m - 1
+				last = int(np.argmin(best[full] + matrix[1:, 0]))
+				if best[full, last] + matrix[last + 1, 0] < np.inf:
+					order = []
+					subset = full
+					while last >= 0:
+						order.append(last + 1)
+						subset, last = subset ^ int(bits[last]), int(parent[subset, last])
+					order.append(0)
+					order.reverse()
+
+		if order is not None:
+			self.bssf = IndexedTSPSolution(self._scenario, order)
+			self._report(start_time, self.bssf, count=1, total=total)
+			self._remember(self.bssf)
+		end_time = time.time()
+
+		results['cost'] = self.bssf.cost if order is not None else math.inf
+		results['time'] = end_time - start_time
+		results['count'] = 1 if order is not None else 0
+		results['soln'] = self.bssf if order is not None else None
+		results['max'] = None
+		results['total'] = total
+		results['pruned'] = None
+		return results
+
+
+
+	''' <summary>
+		Branch and bound spread over a pool of worker processes.  The best states are
+		expanded here until there are PARALLEL_SPLIT of them per worker; after that each
+		worker runs its own best-first search, prunes against a BSSF cost shared between
+		all of them, and hands its best states to any worker that runs dry.
+		</summary>
+		<returns>results dictionary in the same form as branchAndBound; count, total and
+		pruned are summed over the workers, and max is the sum of each worker's largest
+		queue.</returns>
+	'''
+
+	PARALLEL_SPLIT = 4
+
+	def parallelBranchAndBound( self, time_allowance=60.0, workers=None, bound='reduction', incremental=False,
+								max_bytes=MAX_FRONTIER_BYTES ):
+		import multiprocessing
+		bounder = self._bounder(bound, incremental)
+		start_time = time.time()
+		results = {}
+		workers = workers or multiprocessing.cpu_count()
+		ncities = len(self._scenario._cities)
+		matrix, lowerBound = self.createMatrix(True)
+		count = 0
+		pruned = 0
+		total = 1
+		firstTime = None
+		optimal = True
+
+		self._initialBSSF(time_allowance * self.INITIAL_BSSF_SHARE) # The best construction (or the best known tour) fills self.bssf for use later.
+
+		def improve( cost, path ):
+			nonlocal count, firstTime
+			if cost < self.bssf.cost:
+				self.bssf = IndexedTSPSolution(self._scenario, path)
+				count += 1
+				if firstTime is None:
+					firstTime = time.time() - start_time
+				self._report(start_time, self.bssf, count=count, total=total, pruned=pruned)
+
+		# Split the search into enough pieces to keep every worker busy from the start.
+		tieBreaker = itertools.count()
+		root = bounder.root(matrix, lowerBound)
+		frontier = [(root.bound, next(tieBreaker), root)]
+		while frontier and len(frontier) < workers * self.PARALLEL_SPLIT:
+			_, _, current = heapq.heappop(frontier)
+			considered, children = bounder.expand(current, ncities, self.bssf.cost)
+			current.release()
+			total += considered
+			pruned += considered - len(children)
+			for child in children:
+				if child.matrix is None:
+					improve(child.bound, current.path())
+				else:
+					heapq.heappush(frontier, (child.bound, next(tieBreaker), child))
+		splitSize = len(frontier)
+
+		context = multiprocessing.get_context()
+		workQueue = context.Queue()
+		resultQueue = context.Queue()
+		bssfCost = context.Value('d', self.bssf.cost)
+		deadline = context.Value('d', start_time + time_allowance) # Pulled in to stop the workers on cancel.
+		outstanding = context.Value('i', 0)
+		idle = context.Value('i', 0)
+		queued = context.Value('i', 0)
+		for _, _, state in frontier:
+			if state.bound < self.bssf.cost:
+				_shareState(workQueue, state, outstanding, queued)
+			else:
+				pruned += 1
+		frontier = None
+
+		maxFrontier = max(2, max_bytes // BBState.nbytes(ncities, isinstance(bounder, AssignmentBound)) // workers)
+		processes = [context.Process(target=_bbWorker, daemon=True,
+									 args=(workQueue, resultQueue, bssfCost, outstanding, idle, queued,
+										   ncities, deadline, bounder, maxFrontier))
+					 for _ in range(workers)]
+		for process in processes:
+			process.start()
+
+		# Collect new tours as they are found, then every worker's counters.  Once time is
+		# up, whatever is left in the work queue was never searched.  The workers' frontiers
+		# together are at most the sum of their peaks, and the split frontier was all held
+		# at once before them.
+		maxHeapSize = splitSize
+		workerPeaks = 0
+		finished = 0
+		while finished < workers:
+			self._report(start_time, count=count, total=total, pruned=pruned)
+			if self.cancelled():
+				deadline.value = min(deadline.value, time.time())
+			if time.time() >= deadline.value:
+				try:
+					bound = workQueue.get_nowait()[0]
+					if bound > bssfCost.value:
+						pruned += 1
+					else:
+						optimal = False
+					continue
+				except queue.Empty:
+					pass
+			try:
+				message = resultQueue.get(timeout=0.05)
+			except queue.Empty:
+				if not any(process.is_alive() for process in processes):
+					optimal = False
+					break
+				continue
+			if message[0] == 'tour':
+				improve(message[1], message[2])
+			else:
+				_, workerTotal, workerPruned, workerMax, workerOptimal = message
+				total += workerTotal
+				pruned += workerPruned
+				workerPeaks += workerMax
+				maxHeapSize = max(splitSize, workerPeaks)
+				optimal = optimal and workerOptimal
+				finished += 1
+
+		# Empty the work queue before joining: items still in its pipe would keep the
+		# feeder threads (of the workers, and of this process at exit) blocked for good.
+		while True:
+			alive = any(process.is_alive() for process in processes)
+			try:
+				bound = workQueue.get(timeout=0.05)[0]
+			except queue.Empty:
+				if alive:
+					continue
+				break
+			if bound > bssfCost.value:
+				pruned += 1
+			else:
+				optimal = False
+		for process in processes:
+			process.join()
+		self._remember(self.bssf)
+
+		end_time = time.time()
+		results['cost'] = self.bssf.cost
+		results['time'] = end_time - start_time
+		results['count'] = count
+		results['soln'] = self.bssf
+		results['max'] = maxHeapSize
+		results['total'] = total
+		results['pruned'] = pruned
+		results['first'] = firstTime
+		results['optimal'] = optimal
 		return results
 
 
 
 	''' <summary>
 		This is the entry point for the algorithm you'll write for your group project.
+		It improves the greedy tour with LocalSearch (Or-opt and segment-swap moves),
+		then keeps kicking the best tour and re-optimizing until time runs out or
+		FANCY_STALL_LIMIT kicks in a row fail to improve it.  Over DENSE_MAX_CITIES the
+		candidates come from a CandidateIndex and edge costs are computed as needed.
 		</summary>
 		<returns>results dictionary for GUI that contains three ints: cost of best solution,
 		time spent to find best solution, total number of solutions found during search, the
-		best solution found.  You may use the other three field however you like.
+		best solution found.  count is the number of improving moves applied.
 		algorithm</returns>
 	'''
 
+	FANCY_NEIGHBOURS = 10		# candidate list length
+	FANCY_STALL_LIMIT = 200		# kicks in a row without a better tour before giving up early
+
 	def fancy( self,time_allowance=60.0 ):
-		pass
+		start_time = time.time()
+		deadline = start_time + time_allowance
+		results = {}
+		cities = self._scenario.getCities()
+		ncities = len(cities)
+
+		# Start from the best construction (or best known tour), which may still use a
+		# missing edge if they all failed.
+		self._initialBSSF(time_allowance * self.INITIAL_BSSF_SHARE)
+		order = self.bssf.order.tolist()
+
+		if ncities > self.DENSE_MAX_CITIES:
+			index = self._candidateIndex(deadline)
+			dist = PairCosts(self._scenario, INFEASIBLE_EDGE_COST)
+			candidatesOut, candidatesIn = index.neighbors.tolist(), index.incoming.tolist()
+			if not index.complete:
+				# LocalSearch takes every candidate as a city; drop the ones never found.
+				candidatesOut = [[city for city in cities if city >= 0] for cities in candidatesOut]
+				candidatesIn = [[city for city in cities if city >= 0] for cities in candidatesIn]
+		else:
+			matrix = self._scenario.getCostMatrix()
+			dist = costRows(np.where(np.isinf(matrix), INFEASIBLE_EDGE_COST, matrix))
+			candidatesOut, candidatesIn = candidateLists(matrix, self.FANCY_NEIGHBOURS)
+		costs = self._scenario.pairCosts(order, order[1:] + order[:1])
+		length = float(np.where(np.isinf(costs), INFEASIBLE_EDGE_COST, costs).sum())
+		search = LocalSearch(order, dist, candidatesOut, candidatesIn, length)
+		search.optimize(deadline, cancelled=self.cancelled)
+		self._report(start_time, IndexedTSPSolution(self._scenario, search.tour), count=search.improvements)
+
+		# Iterated local search: kick the best tour and re-optimize around the kick, undoing
+		# both if that did not help.
+		bestLength = search.length
+		search.checkpoint()
+		stalls = 0
+		while ncities >= 8 and stalls < self.FANCY_STALL_LIMIT and time.time() < deadline and not self.cancelled():
+			search.optimize(deadline, search.kick(), self.cancelled)
+			if search.length < bestLength - LocalSearch.EPSILON:
+				bestLength = search.length
+				search.checkpoint()
+				stalls = 0
+				self._report(start_time, IndexedTSPSolution(self._scenario, search.tour), count=search.improvements)
+			else:
+				search.rollback()
+				stalls += 1
+
+		self.bssf = IndexedTSPSolution(self._scenario, search.tour)
+		self._remember(self.bssf)
+		end_time = time.time()
+
+		results['cost'] = self.bssf.cost
+		results['time'] = end_time - start_time
+		results['count'] = search.improvements
+		results['soln'] = self.bssf
+		results['max'] = None
+		results['total'] = None
+		results['pruned'] = None
+		return results
+
+
+
+	''' <summary>
+		Genetic algorithm (see GeneticIsland).  The population starts from the initial
+		BSSF (see _initialBSSF), copies of it shaken up by one to three double-bridge kicks, and
+		random tours.  With islands > 1 that many populations evolve in separate processes
+		and pass their best tours round a ring every GENETIC_MIGRATION_INTERVAL generations.
+		Runs until time runs out or GENETIC_STALL_LIMIT generations in a row (on every
+		island) fail to improve.  Needs the cost matrix, so it is meant for scenarios of up
+		to DENSE_MAX_CITIES cities.
+		</summary>
+		<returns>results dictionary for GUI that contains three ints: cost of best solution,
+		time spent to find best solution, number of times the best tour improved, the best
+		solution found, max is the population size (per island) and total the number of
+		children bred.  'generations' is the number of generations over all islands.</returns>
+	'''
+
+	GENETIC_POPULATION = 60
+	GENETIC_STALL_LIMIT = 300
+	GENETIC_MIGRATION_INTERVAL = 20
+
+	def genetic( self, time_allowance=60.0, islands=1, population=GENETIC_POPULATION ):
+		import multiprocessing
+		start_time = time.time()
+		results = {}
+		ncities = len(self._scenario.getCities())
+		matrix = self._scenario.getCostMatrix()
+		count = 0
+
+		self._initialBSSF(time_allowance * self.INITIAL_BSSF_SHARE)
+		initial = self.bssf
+
+		def improve( tour ):
+			nonlocal count
+			soln = IndexedTSPSolution(self._scenario, tour)
+			if soln.cost < self.bssf.cost:
+				self.bssf = soln
+				count += 1
+				self._report(start_time, self.bssf, count=count)
+
+		def seeds():
+			rng = np.random.default_rng(np.random.randint(2**31))
+			tours = [initial.order]
+			while len(tours) < population:
+				if len(tours) % 2 and ncities >= 8:
+					tour = initial.order.tolist()
+					for kick in range(int(rng.integers(1, 4))):
+						p1, p2, p3 = np.sort(rng.choice(np.arange(1, ncities), 3, replace = False))
+						tour = tour[:p1] + tour[p2:p3] + tour[p1:p2] + tour[p3:]
+					tours.append(tour)
+				else:
+					tours.append(rng.permutation(ncities))
+			return np.array(tours), int(rng.integers(2**31))
+
+		generations = 0
+		if ncities < 4:
+			pass # Greedy's tour is the only one there is.
+		elif islands <= 1:
+			tours, seed = seeds()
+			island = GeneticIsland(matrix, tours, np.random.default_rng(seed))
+			bestCost, stalls = island.best()[1], 0
+			while time.time() - start_time < time_allowance and stalls < self.GENETIC_STALL_LIMIT and not self.cancelled():
+				island.step(start_time + time_allowance)
+				tour, cost = island.best()
+				if cost < bestCost:
+					bestCost, stalls = cost, 0
+					improve(tour)
+				else:
+					stalls += 1
+			generations = island.generations
+		else:
+			context = multiprocessing.get_context()
+			resultQueue = context.Queue()
+			inboxes = [context.Queue() for _ in range(islands)]
+			deadline = context.Value('d', start_time + time_allowance) # Pulled in to stop the islands on cancel.
+			processes = []
+			for i in range(islands):
+				tours, seed = seeds()
+				processes.append(context.Process(target=_geneticIsland, daemon=True,
+												 args=(matrix, tours, seed, deadline, self.GENETIC_STALL_LIMIT,
+													   inboxes[i], inboxes[(i + 1) % islands], resultQueue,
+													   self.GENETIC_MIGRATION_INTERVAL)))
+			for process in processes:
+				process.start()
+			finished = 0
+			while finished < islands:
+				self._report(start_time, count=count)
+				if self.cancelled():
+					deadline.value = min(deadline.value, time.time())
+				try:
+					message = resultQueue.get(timeout=0.05)
+				except queue.Empty:
+					if not any(process.is_alive() for process in processes):
+						break
+					continue
+				if message[0] == 'tour':
+					improve(message[2])
+				else:
+					generations += message[1]
+					finished += 1
+			for process in processes:
+				process.join()
+
+		self._remember(self.bssf)
+		end_time = time.time()
+		results['cost'] = self.bssf.cost
+		results['time'] = end_time - start_time
+		results['count'] = count
+		results['soln'] = self.bssf
+		results['max'] = population
+		results['total'] = generations * population
+		results['pruned'] = None
+		results['generations'] = generations
+		return results
+
+
+
+	''' <summary>
+		Simulated annealing over AnnealingTour's swap, reversal and relocation moves,
+		starting from the initial BSSF (see _initialBSSF).  Moves are drawn and scored a batch
+		at a time and the first one the Metropolis rule accepts is applied; the rest of
+		the batch is thrown away, so the walk is the same as scoring moves one by one.
+		Batches are sized from how long the last acceptance took to come.  The starting
+		temperature makes a typical uphill move around the initial tour a coin flip, and
+		it cools geometrically to ANNEAL_FINAL_FRACTION of that over the run, which lasts
+		the time allowance or ANNEAL_SECONDS_PER_CITY per city, whichever is shorter.
+		After ANNEAL_RESTART_MOVES moves per city without a new best tour, the walk goes
+		back to the best one.
+		</summary>
+		<returns>results dictionary for GUI that contains three ints: cost of best solution,
+		time spent to find best solution, number of times the best tour improved, the best
+		solution found, and total, the number of moves scored.  'accepted' counts the
+		moves applied and 'restarts' the returns to the best tour.</returns>
+	'''
+
+	ANNEAL_SECONDS_PER_CITY = 0.05
+	ANNEAL_FINAL_FRACTION = 1e-3	# final temperature, as a fraction of the starting one
+	ANNEAL_RESTART_MOVES = 2000		# per city
+	ANNEAL_MAX_BATCH = 4096
+
+	def annealing( self, time_allowance=60.0 ):
+		start_time = time.time()
+		results = {}
+		ncities = len(self._scenario.getCities())
+		matrix = self._scenario.getCostMatrix()
+		count = accepted = total = restarts = 0
+
+		self._initialBSSF(time_allowance * self.INITIAL_BSSF_SHARE)
+		if ncities >= 5:
+			rng = np.random.default_rng(np.random.randint(2**31))
+			walk = AnnealingTour(np.where(np.isinf(matrix), INFEASIBLE_EDGE_COST, matrix), self.bssf.order)
+			best, bestCost = walk.tour, walk.cost
+
+			sample = walk.deltas(*walk.sample(rng, 1000))
+			uphill = sample[(sample > 0) & (sample < INFEASIBLE_EDGE_COST / 2)]
+			startTemperature = np.median(uphill) / math.log(2) if len(uphill) else 1.0
+			duration = min(time_allowance, max(1.0, self.ANNEAL_SECONDS_PER_CITY * ncities))
+			batch = 64
+			sinceBest = 0
+			while not self.cancelled():
+				elapsed = time.time() - start_time
+				if elapsed >= duration:
+					break
+				temperature = startTemperature * self.ANNEAL_FINAL_FRACTION ** (elapsed / duration)
+				moves = walk.sample(rng, batch)
+				deltas = walk.deltas(*moves)
+				hits = np.flatnonzero(rng.random(batch) < np.exp(-np.maximum(deltas, 0.0) / temperature))
+				if len(hits) == 0:
+					total += batch
+					sinceBest += batch
+					batch = min(2 * batch, self.ANNEAL_MAX_BATCH)
+					continue
+
+				first = hits[0]
+				total += first + 1
+				sinceBest += first + 1
+				batch = int(np.clip(2 * (first + 1), 16, self.ANNEAL_MAX_BATCH))
+				walk.apply(*(int(move[first]) for move in moves))
+				accepted += 1
+				if walk.cost < bestCost - LocalSearch.EPSILON:
+					best, bestCost = walk.tour, walk.cost
+					sinceBest = 0
+					count += 1
+					if time.time() - self._lastProgress >= self.PROGRESS_INTERVAL:
+						self._report(start_time, IndexedTSPSolution(self._scenario, best), count=count, total=total)
+				elif sinceBest >= self.ANNEAL_RESTART_MOVES * ncities:
+					walk.setTour(best)
+					sinceBest = 0
+					restarts += 1
+
+			soln = IndexedTSPSolution(self._scenario, best)
+			if soln.cost <= self.bssf.cost:
+				self.bssf = soln
+		self._remember(self.bssf)
+		end_time = time.time()
+
+		results['cost'] = self.bssf.cost
+		results['time'] = end_time - start_time
+		results['count'] = count
+		results['soln'] = self.bssf
+		results['max'] = None
+		results['total'] = int(total)
+		results['pruned'] = None
+		results['accepted'] = accepted
+		results['restarts'] = restarts
+		return results
+
+
+
+	''' <summary>
+		Ant colony optimization (MAX-MIN ant system).  A pheromone matrix sits beside the
+		cost matrix; every iteration ACO_ANTS ants build tours in lock-step, each step
+		choosing their next city by roulette over pheromone**ACO_ALPHA times
+		(1 / (cost + 1))**ACO_BETA with visited cities and missing edges weighted zero.  An
+		ant with nowhere left to go takes the lowest-numbered unvisited city over a missing
+		edge, and its tour then deposits nothing.  The iteration's best tour is polished with
+		LocalSearch; then all pheromone evaporates by ACO_EVAPORATION, the feasible tours
+		and the best tour so far deposit 1 / cost on their edges, and the trails are clamped
+		between the MAX-MIN limits so the colony doesn't lock onto one tour.  Stops when time
+		runs out or after ACO_STALL_LIMIT iterations without a better tour.
+		</summary>
+		<returns>results dictionary for GUI that contains three ints: cost of best solution,
+		time spent to find best solution, number of times the best tour improved, the best
+		solution found, max is the number of ants and total the number of tours built.
+		'iterations' is the number of colony iterations.</returns>
+	'''
+
+	ACO_ANTS = 32
+	ACO_ALPHA = 1.0
+	ACO_BETA = 3.0
+	ACO_EVAPORATION = 0.1
+	ACO_STALL_LIMIT = 100
+
+	def antColony( self, time_allowance=60.0 ):
+		start_time = time.time()
+		deadline = start_time + time_allowance
+		results = {}
+		ncities = len(self._scenario.getCities())
+		matrix, _ = self.createMatrix(False)
+		count = iterations = 0
+
+		self._initialBSSF(time_allowance * self.INITIAL_BSSF_SHARE)
+		best, bestCost = self.bssf.order, self.bssf.cost
+		if ncities >= 5:
+			ants = self.ACO_ANTS
+			reachable = matrix < np.inf
+			heuristic = np.where(reachable, 1.0 / (np.where(reachable, matrix, 0.0) + 1.0), 0.0) ** self.ACO_BETA
+			limit = bestCost if bestCost < math.inf else np.sum(np.min(np.where(reachable, matrix, np.inf), axis = 1))
+			maxTrail = 1.0 / (self.ACO_EVAPORATION * max(limit, 1.0))
+			minTrail = maxTrail / (2 * ncities)
+			pheromone = np.full(matrix.shape, maxTrail)
+			search = LocalSearch(best.tolist(), costRows(np.where(reachable, matrix, INFEASIBLE_EDGE_COST)),
+								 *candidateLists(matrix, self.FANCY_NEIGHBOURS))
+			everyAnt = np.arange(ants)
+			tours = np.empty((ants, ncities), dtype = np.intp)
+			stalls = 0
+
+			while stalls < self.ACO_STALL_LIMIT and time.time() < deadline and not self.cancelled():
+				weights = pheromone ** self.ACO_ALPHA * heuristic
+				tours[:, 0] = np.random.randint(ncities, size = ants)
+				visited = np.zeros((ants, ncities), dtype = bool)
+				visited[everyAnt, tours[:, 0]] = True
+				for step in range(1, ncities):
+					rows = np.where(visited, 0.0, weights[tours[:, step - 1]])
+					cumulative = np.cumsum(rows, axis = 1)
+					spin = np.random.random(ants) * cumulative[:, -1]
+					nextCities = np.argmax(cumulative > spin[:, np.newaxis], axis = 1)
+					stuck = cumulative[:, -1] == 0.0
+					nextCities[stuck] = np.argmin(visited[stuck], axis = 1)
+					tours[:, step] = nextCities
+					visited[everyAnt, nextCities] = True
+				costs = IndexedTSPSolution.tourCosts(matrix, tours)
+				iterations += 1
+
+				# Polish the iteration's best tour and keep it if it beats the best so far.
+				leader = int(np.argmin(costs))
+				search.setTour(tours[leader].tolist())
+				search.optimize(deadline, cancelled=self.cancelled)
+				polished = IndexedTSPSolution(self._scenario, search.tour)
+				if polished.cost < bestCost:
+					best, bestCost = polished.order, polished.cost
+					self.bssf = polished
+					count += 1
+					stalls = 0
+					self._report(start_time, self.bssf, count=count, total=iterations * ants)
+				else:
+					stalls += 1
+
+				feasible = costs < np.inf
+				pheromone *= 1.0 - self.ACO_EVAPORATION
+				np.add.at(pheromone, (tours[feasible], np.roll(tours[feasible], -1, axis = 1)),
+						  (1.0 / costs[feasible])[:, np.newaxis])
+				if bestCost < math.inf:
+					pheromone[best, np.roll(best, -1)] += 1.0 / bestCost
+					maxTrail = 1.0 / (self.ACO_EVAPORATION * max(bestCost, 1.0))
+					minTrail = maxTrail / (2 * ncities)
+				np.clip(pheromone, minTrail, maxTrail, out = pheromone)
+		self._remember(self.bssf)
+		end_time = time.time()
+
+		results['cost'] = self.bssf.cost
+		results['time'] = end_time - start_time
+		results['count'] = count
+		results['soln'] = self.bssf
+		results['max'] = self.ACO_ANTS
+		results['total'] = iterations * self.ACO_ANTS
+		results['pruned'] = None
+		results['iterations'] = iterations
+		return results
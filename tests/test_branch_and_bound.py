@@ -0,0 +1,88 @@
+import subprocess
+import sys
+import tracemalloc
+
+import numpy as np
+
+from conftest import ROOT
+from TSPClasses import Scenario, newPoints
+from TSPSolver import TSPSolver
+
+
+def makeSolver( size, seed, difficulty='Hard (Deterministic)' ):
+	np.random.seed(seed)
+	scenario = Scenario(city_locations=newPoints(size, seed), difficulty=difficulty, rand_seed=seed)
+	solver = TSPSolver(None)
+	solver.setupWithScenario(scenario)
+	return solver
+
+
+# Run in a child process so a search that finishes but never lets the interpreter exit
+# fails the test instead of hanging it.
+PARALLEL_SCRIPT = '''
+import numpy as np
+from TSPClasses import Scenario, newPoints
+from TSPSolver import TSPSolver
+np.random.seed(3)
+scenario = Scenario(city_locations=newPoints(60, 3), difficulty='Hard (Deterministic)', rand_seed=3)
+solver = TSPSolver(None)
+solver.setupWithScenario(scenario)
+results = solver.parallelBranchAndBound(time_allowance=1.0, workers={workers})
+print(results['cost'], results['optimal'])
+'''
+
+def test_parallel_exits_after_timeout():
+	for workers in (1, 2):
+		done = subprocess.run([sys.executable, '-c', PARALLEL_SCRIPT.format(workers=workers)], cwd=ROOT,
+							  capture_output=True, text=True, timeout=60)
+		assert done.returncode == 0, done.stderr
+		cost, optimal = done.stdout.split()
+		assert float(cost) < np.inf
+		assert optimal == 'False'
+
+def test_parallel_matches_serial():
+	serial = makeSolver(12, 5).branchAndBound(time_allowance=30.0)
+	parallel = makeSolver(12, 5).parallelBranchAndBound(time_allowance=30.0, workers=2)
+	assert serial['optimal'] and parallel['optimal']
+	assert parallel['cost'] == serial['cost']
+
+def test_children_own_their_matrices():
+	solver = makeSolver(15, 2)
+	matrix, lowerBound = solver.createMatrix(True)
+	for incremental in (False, True):
+		bounder = solver.BOUNDS['reduction'](incremental)
+		root = bounder.root(matrix, lowerBound)
+		_, children = bounder.expand(root, 15, np.inf)
+		assert children
+		for child in children:
+			assert child.matrix.base is None
+			assert not np.shares_memory(child.matrix, root.matrix)
+
+def test_batched_and_incremental_children_agree():
+	solver = makeSolver(15, 2)
+	matrix, lowerBound = solver.createMatrix(True)
+	batched, incremental = (solver.BOUNDS['reduction'](flag) for flag in (False, True))
+	_, first = batched.expand(batched.root(matrix, lowerBound), 15, np.inf)
+	_, second = incremental.expand(incremental.root(matrix, lowerBound), 15, np.inf)
+	for a, b in zip(first, second):
+		assert (a.city, a.bound) == (b.city, b.bound)
+		assert np.array_equal(a.matrix, b.matrix)
+
+def test_frontier_stays_under_max_bytes():
+	maxBytes = 2 * 1024**2
+	for strategy, bound in (('best', 'reduction'), ('best', 'assignment'), ('hybrid', 'reduction')):
+		solver = makeSolver(25, 1)
+		solver._scenario.getCostMatrix() # Built once, outside the measurement.
+		solver._initialBSSF()
+		tracemalloc.start()
+		try:
+			base = tracemalloc.get_traced_memory()[0]
+			results = solver.branchAndBound(time_allowance=3.0, strategy=strategy, bound=bound, max_bytes=maxBytes)
+			peak = tracemalloc.get_traced_memory()[1] - base
+		finally:
+			tracemalloc.stop()
+		assert results['bytes'] <= maxBytes
+		# Besides the frontier, only the state being expanded and its children are live.
+		assert peak <= maxBytes * 1.1
+		if strategy == 'best':
+			assert not results['optimal'] # The cap was actually hit.
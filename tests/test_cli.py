@@ -0,0 +1,24 @@
+import contextlib
+import io
+import json
+
+from Proj5CLI import main
+from TSPBatch import makeScenario
+from TSPCache import ScenarioCache
+from TSPClasses import Scenario
+
+
+def runCLI( argv ):
+	out = io.StringIO()
+	with contextlib.redirect_stdout(out):
+		assert main(argv) == 0
+	return [json.loads(line) for line in out.getvalue().splitlines()]
+
+# In 'Hard' mode edges are thinned with numpy's global generator, so this only holds if
+# every entry point seeds it the same way.
+def test_cli_scenario_matches_batch( tmp_path ):
+	path = str(tmp_path / 'scenario.bin')
+	for difficulty in ('Hard', 'Hard (Deterministic)'):
+		runCLI(['-n', '30', '-s', '7', '-d', difficulty, '-a', 'greedy', '--save-scenario', path])
+		spec = {'size': 30, 'seed': 7, 'difficulty': difficulty}
+		assert ScenarioCache.key(Scenario.load(path)) == ScenarioCache.key(makeScenario(spec))
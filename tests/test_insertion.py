@@ -0,0 +1,48 @@
+import time
+
+import numpy as np
+
+from TSPSolver import insertionTour
+
+
+# Straightforward version: every step scores every city on every tour edge.
+def referenceTour( d, farthest ):
+	n = len(d)
+	cycles = d + d.T
+	np.fill_diagonal(cycles, np.inf)
+	a, b = divmod(int(np.argmin(cycles)), n)
+	tour = [a, b]
+	while len(tour) < n:
+		rest = [c for c in range(n) if c not in tour]
+		edges = list(zip(tour, tour[1:] + tour[:1]))
+		costs = {c: min((d[u, c] + d[c, v] - d[u, v], i) for i, (u, v) in enumerate(edges)) for c in rest}
+		if farthest:
+			c = max(rest, key=lambda c: min(min(d[c, t], d[t, c]) for t in tour))
+		else:
+			c = min(rest, key=lambda c: costs[c][0])
+		tour.insert(costs[c][1] + 1, c)
+	return tour
+
+def tourCost( d, tour ):
+	return sum(d[a, b] for a, b in zip(tour, np.roll(tour, -1)))
+
+# Real-valued costs, so there are no ties to break differently.
+def test_matches_reference():
+	rng = np.random.default_rng(0)
+	for trial in range(30):
+		n = int(rng.integers(3, 40))
+		d = rng.random((n, n)) * 100
+		np.fill_diagonal(d, np.inf)
+		for farthest in (False, True):
+			tour = insertionTour(d, farthest)
+			assert sorted(tour) == list(range(n))
+			assert np.isclose(tourCost(d, tour), tourCost(d, referenceTour(d, farthest)))
+
+def test_stops_at_deadline():
+	rng = np.random.default_rng(1)
+	d = rng.random((2000, 2000)) * 100
+	np.fill_diagonal(d, np.inf)
+	start = time.time()
+	tour = insertionTour(d, False, deadline=start)
+	assert time.time() - start < 0.5
+	assert sorted(tour) == list(range(2000))
@@ -0,0 +1,68 @@
+import numpy as np
+
+from TSPSolver import ROW_LIST_LIMIT, LocalSearch, candidateLists, costRows
+
+
+def randomSearch( rng, n ):
+	matrix = rng.integers(1, 100, (n, n)).astype(float)
+	np.fill_diagonal(matrix, np.inf)
+	dist = np.where(np.isinf(matrix), 1e9, matrix).tolist()
+	return LocalSearch(rng.permutation(n).tolist(), dist, *candidateLists(matrix, 5)), dist
+
+def checkConsistent( search, dist ):
+	tour = search.tour
+	assert sorted(tour) == list(range(search.n))
+	assert all(search.pos[city] == i for i, city in enumerate(tour))
+	length = sum(dist[a][b] for a, b in zip(tour, tour[1:] + tour[:1]))
+	assert abs(length - search.length) < 1e-6
+
+# Moves only rewrite part of the tour, so check the positions and the running length
+# against the tour itself after every round.
+def test_moves_keep_tour_consistent():
+	rng = np.random.default_rng(0)
+	for trial in range(100):
+		search, dist = randomSearch(rng, int(rng.integers(5, 40)))
+		search.optimize(float('inf'))
+		checkConsistent(search, dist)
+		if search.n >= 8:
+			for kick in range(5):
+				search.optimize(float('inf'), search.kick())
+				checkConsistent(search, dist)
+
+def test_rollback_restores_checkpoint():
+	rng = np.random.default_rng(1)
+	for trial in range(50):
+		search, dist = randomSearch(rng, int(rng.integers(8, 40)))
+		search.optimize(float('inf'))
+		search.checkpoint()
+		tour, length = list(search.tour), search.length
+		for kick in range(5):
+			search.optimize(float('inf'), search.kick())
+		search.rollback()
+		assert search.tour == tour and search.length == length
+		checkConsistent(search, dist)
+
+def test_exchange_rewrites_shorter_side():
+	search, dist = randomSearch(np.random.default_rng(2), 1000)
+	before = list(search.tour)
+	search._exchange(10, 12, 990) # Cheapest as moving the 2-city block past the 20 others.
+	changed = sum(a != b for a, b in zip(before, search.tour))
+	assert changed <= 22
+	expected = before[:10] + before[12:990] + before[10:12] + before[990:]
+	i = search.pos[expected[0]]
+	assert search.tour[i:] + search.tour[:i] == expected
+
+# Big matrices come as memoryview rows instead of lists; the search must not care.
+def test_row_views_match_lists():
+	rng = np.random.default_rng(3)
+	n = ROW_LIST_LIMIT + 1
+	matrix = rng.integers(1, 100, (n, n)).astype(float)
+	np.fill_diagonal(matrix, 1e9)
+	rows = costRows(matrix)
+	assert isinstance(rows[0], memoryview) and rows[3][7] == matrix[3, 7]
+	order = rng.permutation(n).tolist()
+	candidates = candidateLists(matrix, 5)
+	views, lists = LocalSearch(order, rows, *candidates), LocalSearch(order, matrix.tolist(), *candidates)
+	for search in (views, lists):
+		search.optimize(float('inf'))
+	assert views.tour == lists.tour and views.length == lists.length
@@ -0,0 +1,55 @@
+import time
+
+import numpy as np
+
+from TSPClasses import Scenario, newPoints
+from TSPNeighbors import CandidateIndex
+from TSPSolver import TSPSolver
+
+
+def makeScenario( size, seed, difficulty='Hard (Deterministic)' ):
+	np.random.seed(seed)
+	return Scenario(city_locations=newPoints(size, seed), difficulty=difficulty, rand_seed=seed)
+
+def test_index_matches_matrix():
+	scenario = makeScenario(300, 1)
+	matrix = scenario.getCostMatrix()
+	index = CandidateIndex(scenario, 5)
+	assert index.complete
+	assert np.array_equal(index.costs, np.sort(matrix, axis=1)[:, :5])
+	assert np.array_equal(index.incomingCosts, np.sort(matrix, axis=0)[:5].T)
+
+def test_index_past_deadline_still_answers():
+	scenario = makeScenario(300, 2)
+	index = CandidateIndex(scenario, 5, deadline=time.time() - 1)
+	assert not index.complete
+	assert (index.neighbors == -1).all() and np.isinf(index.costs).all()
+	visited = np.zeros(300, dtype=bool)
+	visited[0] = True
+	city = index.cheapestFrom(0, visited)
+	assert scenario.getCostMatrix()[0, city] == scenario.getCostMatrix()[0, 1:].min()
+
+# The candidate index counts against greedy's time, and a sparse greedy that runs out of
+# it still returns a whole tour.
+def test_sparse_greedy_keeps_to_time_allowance():
+	solver = TSPSolver(None)
+	solver.DENSE_MAX_CITIES = 100
+	solver.setupWithScenario(makeScenario(3000, 3))
+	results = solver.greedy(time_allowance=0.0)
+	assert sorted(results['soln'].order.tolist()) == list(range(3000))
+	assert results['time'] < 1.0
+	assert not solver._candidateIndex(time.time() - 1).complete
+	assert solver._candidateIndex().complete
+
+# costTo reads the cost matrix, building it on first use, except for lazy-edge scenarios.
+def test_cost_to_uses_matrix():
+	scenario = makeScenario(50, 4)
+	cities = scenario.getCities()
+	assert scenario._cost_matrix is None
+	cost = cities[0].costTo(cities[1])
+	assert scenario._cost_matrix is not None
+	assert cost == scenario._cost_matrix[0, 1]
+	lazy = Scenario(city_locations=newPoints(50, 4), difficulty='Hard (Deterministic)', rand_seed=4,
+					thin_version=Scenario.LAZY_EDGE_VERSION)
+	lazy.getCities()[0].costTo(lazy.getCities()[1])
+	assert lazy._cost_matrix is None
@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+
+from TSPClasses import Scenario, newPoints
+
+
+def makeScenario( size, seed, difficulty='Hard (Deterministic)' ):
+	np.random.seed(seed)
+	return Scenario(city_locations=newPoints(size, seed), difficulty=difficulty, rand_seed=seed)
+
+def test_round_trip_maps_mask_and_matrix( tmp_path ):
+	path = str(tmp_path / 'scenario.bin')
+	scenario = makeScenario(40, 5)
+	scenario.save(path)
+	loaded = Scenario.load(path)
+	assert loaded.params() == scenario.params()
+	assert np.array_equal(loaded.getCostMatrix(), scenario.getCostMatrix())
+	assert np.array_equal(loaded.getEdgeMask(), scenario.getEdgeMask())
+	assert isinstance(loaded.getEdgeMask().base, np.memmap)
+
+# The checksum covers the header too, so a changed seed is caught like a changed cost.
+def test_corrupt_header_fails_checksum( tmp_path ):
+	path = str(tmp_path / 'scenario.bin')
+	makeScenario(40, 5).save(path)
+	with open(path, 'rb') as f:
+		data = f.read()
+	assert data.count(b'"seed": 5') == 1
+	with open(path, 'wb') as f:
+		f.write(data.replace(b'"seed": 5', b'"seed": 6'))
+	with pytest.raises(ValueError):
+		Scenario.load(path)
+	assert Scenario.load(path, verify=False).params()['seed'] == 6